@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+import pandas as pd
+
+from schema import split_submissions
+from scoring import get_scoring_engine
+
+
+class AggregateStore:
+    """Materialized per-(country, period_of_review, section) scores.
+
+    Every stored submission is folded in by ``apply``; the latest submission
+    of a country and period replaces the previous one. Dashboard reads are a
+    query over a few rows per assessment instead of a full-sheet read.
+    The answers themselves are kept by stable question and option id, so a
+    new assessment can start from the previous period's.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS section_scores ("
+                "country TEXT, period_of_review TEXT, section TEXT, score REAL, answered INTEGER, "
+                "PRIMARY KEY (country, period_of_review, section))")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS submission_totals ("
+                "country TEXT, period_of_review TEXT, total_score REAL, maturity_level TEXT, "
+                "date_of_assessment TEXT, PRIMARY KEY (country, period_of_review))")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS submission_answers ("
+                "country TEXT, period_of_review TEXT, question_id INTEGER, option_code INTEGER, text TEXT, "
+                "instrument_version TEXT, PRIMARY KEY (country, period_of_review, question_id)) WITHOUT ROWID")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def apply(self, df):
+        # Only the latest submission of each country and period counts
+        latest = df.groupby(["country", "period_of_review"])["date_of_assessment"].transform("max")
+        frame = df[df["date_of_assessment"] == latest].copy()
+        frame["score"] = pd.to_numeric(frame["score"], errors="coerce")
+        frame["answered"] = frame["score"] > 0
+        sections = frame.groupby(["country", "period_of_review", "section"], sort=False).agg(
+            score=("score", "sum"), answered=("answered", "sum")).reset_index()
+        # The methodology total is a weighted sum of the section scores
+        engine = get_scoring_engine()
+        frame["weighted_score"] = frame["score"] * frame["section"].map(
+            dict(zip(engine.section_titles, engine.section_factors)))
+        totals = frame.groupby(["country", "period_of_review"], sort=False).agg(
+            total_score=("weighted_score", "sum"), maturity_level=("maturity_level", "last"),
+            date_of_assessment=("date_of_assessment", "last")).reset_index()
+        totals["date_of_assessment"] = totals["date_of_assessment"].astype(str)
+        submissions, responses, comments, skipped = split_submissions(frame, engine.bank, strict=False)
+        answers = pd.concat([responses[responses["option_code"] >= 0].assign(text=None),
+                             comments.assign(option_code=-1)], ignore_index=True)
+        answers = answers.join(submissions.set_index("submission_id")[["country", "period_of_review"]],
+                               on="submission_id")
+        with self._write_lock, closing(self.connect()) as connection, connection:
+            keys = list(totals[["country", "period_of_review"]].itertuples(index=False, name=None))
+            connection.executemany(
+                "DELETE FROM section_scores WHERE country = ? AND period_of_review = ?", keys)
+            connection.executemany(
+                "INSERT INTO section_scores VALUES (?, ?, ?, ?, ?)",
+                [(c, p, s, float(score), int(answered)) for c, p, s, score, answered
+                 in sections.itertuples(index=False, name=None)])
+            connection.executemany(
+                "DELETE FROM submission_answers WHERE country = ? AND period_of_review = ?", keys)
+            connection.executemany(
+                "INSERT OR REPLACE INTO submission_answers VALUES (?, ?, ?, ?, ?, ?)",
+                [(c, p, int(q), int(o), text, engine.bank.version) for c, p, q, o, text
+                 in answers[["country", "period_of_review", "question_id", "option_code", "text"]].itertuples(
+                     index=False, name=None)])
+            connection.executemany(
+                "INSERT OR REPLACE INTO submission_totals VALUES (?, ?, ?, ?, ?)",
+                [(c, p, float(total), level, date) for c, p, total, level, date
+                 in totals.itertuples(index=False, name=None)])
+        # Rows whose question is not in the instrument, left out of the answers
+        return skipped
+
+    def rebuild(self, df):
+        # Recompute everything from the stored flat rows (one-off backfill)
+        with self._write_lock, closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM section_scores")
+            connection.execute("DELETE FROM submission_totals")
+            connection.execute("DELETE FROM submission_answers")
+        return self.apply(df) if not df.empty else 0
+
+    def section_scores(self):
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query("SELECT * FROM section_scores", connection)
+
+    def submission_totals(self):
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query("SELECT * FROM submission_totals", connection)
+
+    def answered_periods(self, country):
+        with closing(self.connect()) as connection:
+            return [period for (period,) in connection.execute(
+                "SELECT DISTINCT period_of_review FROM submission_answers WHERE country = ?", (country,))]
+
+    def answers(self, country, period_of_review):
+        # One indexed lookup on the (country, period_of_review) key
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query(
+                "SELECT question_id, option_code, text, instrument_version FROM submission_answers "
+                "WHERE country = ? AND period_of_review = ?", connection, params=(country, period_of_review))
+
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregate_store():
+    global _aggregates
+    with _aggregates_lock:
+        if _aggregates is None:
+            _aggregates = AggregateStore(os.environ.get("ICSPS_AGGREGATES_PATH", "data/aggregates.sqlite3"))
+        return _aggregates
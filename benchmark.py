@@ -0,0 +1,479 @@
+"""Benchmarks for the Data Entry rerun and submit paths.
+
+Runs the app with Streamlit's AppTest harness against an in-memory fake of
+the Google Sheet, so nothing leaves the machine:
+
+- ``rerun``: latency of a rerun after each radio change
+- ``memory``: memory held per filled-in session
+- ``submit``: ``append_to_sheet`` append/upsert, the duplicate check and cached reads
+  against sheets of 1k/10k/100k rows
+- ``concurrency``: N assessors filling in and submitting at the same time
+- ``startup``: import time of each app module and the first Home Page run, in
+  fresh interpreters, and which heavy packages they load
+
+Results are printed (or written with ``--out``) as JSON so runs of
+different releases can be compared.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --only submit --sizes 1000,10000 --api-latency-ms 50
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+SHEET_NAME = "benchmark"
+SUITES = ("rerun", "memory", "submit", "concurrency", "startup")
+# Modules timed by the startup suite, in the order the app reaches them
+APP_MODULES = ("telemetry", "content", "app", "question_bank", "scoring", "sheets", "dependencies",
+               "storage", "spool", "data_entry", "bulk_import", "dashboard")
+# Packages the Home Page should not need
+HEAVY_MODULES = ("pandas", "pyarrow", "gspread", "google.auth", "google.oauth2", "gspread_dataframe",
+                 "dependencies", "storage")
+HOME_PAGE_SCRIPT = """
+import json, sys, time
+import streamlit_option_menu
+from streamlit.testing.v1 import AppTest
+streamlit_option_menu.option_menu = lambda *args, **kwargs: "Home Page"
+loaded = set(sys.modules)
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter()
+at.run()
+print(json.dumps({"seconds": time.perf_counter() - start, "exceptions": len(at.exception),
+                  "loaded": sorted(set(sys.modules) - loaded)}))
+"""
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def batch_update(self, body):
+        self.worksheet._call()
+        with self.worksheet.lock:
+            for request in body["requests"]:
+                grid = request["deleteDimension"]["range"]
+                del self.worksheet.rows[grid["startIndex"]:grid["endIndex"]]
+
+
+class FakeWorksheet:
+    """The subset of gspread.Worksheet the app uses, kept in a list of rows.
+
+    Every API method counts as one request and sleeps ``latency`` seconds to
+    stand in for the network round trip.
+    """
+
+    id = 0
+    title = "Sheet1"
+
+    def __init__(self, rows=(), latency=0.0):
+        self.rows = [list(row) for row in rows]
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.spreadsheet = FakeSpreadsheet(self)
+        self._col_count = 26
+
+    def _call(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def col_count(self):
+        return max(self._col_count, max((len(row) for row in self.rows), default=0))
+
+    def add_cols(self, count):
+        self._call()
+        self._col_count = self.col_count + count
+
+    def row_values(self, row):
+        self._call()
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def batch_get(self, ranges):
+        self._call()
+        result = []
+        for a1 in ranges:
+            grid = a1_range_to_grid_range(a1)
+            start, end = grid.get("startRowIndex", 0), grid.get("endRowIndex", len(self.rows))
+            columns = slice(grid.get("startColumnIndex", 0), grid.get("endColumnIndex"))
+            result.append([[str(value) for value in row[columns]] for row in self.rows[start:end]])
+        return result
+
+    def append_rows(self, values, value_input_option=None, insert_data_option=None, table_range=None):
+        self._call()
+        with self.lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(row) for row in values)
+            last = len(self.rows)
+        width = max(len(row) for row in values)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:{rowcol_to_a1(last, width)}"}}
+
+    def update(self, range_name=None, values=None, value_input_option=None):
+        self._call()
+        grid = a1_range_to_grid_range(range_name)
+        with self.lock:
+            for offset, row in enumerate(values):
+                index = grid["startRowIndex"] + offset
+                while len(self.rows) <= index:
+                    self.rows.append([])
+                target = self.rows[index]
+                start = grid.get("startColumnIndex", 0)
+                target.extend([""] * max(0, start + len(row) - len(target)))
+                target[start:start + len(row)] = row
+
+    def col_values(self, col):
+        self._call()
+        values = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+        while values and values[-1] in ("", None):
+            values.pop()
+        return values
+
+    def get(self, range_name=None, pad_values=False):
+        self._call()
+        with self.lock:
+            rows = [[str(value) for value in row] for row in self.rows]
+        width = max((len(row) for row in rows), default=0)
+        return [row + [""] * (width - len(row)) for row in rows] if pad_values else rows
+
+    def get_all_records(self):
+        self._call()
+        header = self.rows[0] if self.rows else []
+        return [dict(zip(header, row)) for row in self.rows[1:]]
+
+
+class FakeConnection:
+    def __init__(self, worksheet):
+        self.sheet = worksheet
+
+    def client(self):
+        return None
+
+    def worksheet(self, sheet_name, index=0):
+        return self.sheet
+
+    def invalidate(self, sheet_name=None):
+        pass
+
+
+def _configure_environment(workdir):
+    # Synchronous writes to the fake sheet; every local store goes to a scratch directory
+    os.environ.update({
+        "ICSPS_STORAGE_BACKEND": "sheets",
+        "ICSPS_SHEET_NAME": SHEET_NAME,
+        "ICSPS_WRITE_BEHIND": "0",
+        "ICSPS_DRAFTS_PATH": os.path.join(workdir, "drafts.sqlite3"),
+        "ICSPS_AGGREGATES_PATH": os.path.join(workdir, "aggregates.sqlite3"),
+        "ICSPS_SPOOL_PATH": os.path.join(workdir, "spool.sqlite3"),
+        "ICSPS_SHEET_CACHE_PATH": os.path.join(workdir, "sheet_cache.sqlite3"),
+    })
+    import streamlit_option_menu
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: "Data Entry"
+
+
+def _use_sheet(worksheet):
+    import dependencies
+    import sheet_cache
+    import sheets
+    sheets._connection = FakeConnection(worksheet)
+    dependencies._sheet_headers.clear()
+    dependencies._sheet_indexes.clear()
+    sheet_cache._cache = None
+    if os.path.exists(os.environ.get("ICSPS_SHEET_CACHE_PATH", "")):
+        os.remove(os.environ["ICSPS_SHEET_CACHE_PATH"])
+
+
+def _summary(seconds):
+    seconds = sorted(seconds)
+    return {
+        "n": len(seconds),
+        "mean_ms": round(1000 * statistics.fmean(seconds), 3),
+        "p50_ms": round(1000 * seconds[len(seconds) // 2], 3),
+        "p95_ms": round(1000 * seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))], 3),
+        "max_ms": round(1000 * seconds[-1], 3),
+    }
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _session(draft_id):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    # A separate draft per simulated tab
+    at.query_params["draft"] = draft_id
+    return at
+
+
+def _fill(at, rng, country, period):
+    from question_bank import QUESTION_BANK
+    for question in QUESTION_BANK.questions:
+        at.radio(key=question.key).set_value(int(rng.integers(len(question.options))))
+    at.selectbox(key="country_name").set_value(country)
+    at.selectbox(key="period_of_review").set_value(period)
+    at.text_input(key="assessors_name").input("Benchmark")
+    at.text_input(key="assessors_affiliation").input("Benchmark")
+
+
+def bench_rerun(changes, rng):
+    """Rerun latency of the Data Entry page after single radio changes."""
+    from question_bank import QUESTION_BANK
+    _use_sheet(FakeWorksheet())
+    at = _session("bench-rerun")
+    first = _timed(at.run)
+    timings = []
+    for i in range(changes):
+        question = QUESTION_BANK.questions[i % len(QUESTION_BANK.questions)]
+        at.radio(key=question.key).set_value(int(rng.integers(len(question.options))))
+        timings.append(_timed(at.run))
+    return {"first_run_ms": round(1000 * first, 3), "per_change": _summary(timings),
+            "exceptions": len(at.exception)}
+
+
+def bench_memory(sessions, rng):
+    """Python heap held per session with every question answered."""
+    _use_sheet(FakeWorksheet())
+    # Warm up imports and caches so only per-session memory is counted
+    warm = _session("bench-memory-warmup")
+    warm.run()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = []
+    for i in range(sessions):
+        at = _session(f"bench-memory-{i}")
+        at.run()
+        _fill(at, rng, "Nigeria", "Q1 2024")
+        at.run()
+        kept.append(at)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return {"sessions": sessions, "bytes_per_session": int(grown / sessions)}
+
+
+def _sheet_rows(n_rows):
+    # n_rows of stored assessments (46 rows each) for distinct countries, plus the header
+    from dependencies import assessment_frame, dataframe_to_rows
+    from question_bank import QUESTION_BANK
+    from schema import ASSESSMENT_COLUMNS
+    frame = assessment_frame(np.zeros(len(QUESTION_BANK.questions), dtype=np.int8), {}, {
+        "country": "", "assessors_name": "bench", "assessors_affiliation": "bench",
+        "period_of_review": "Q1 2024", "date_of_assessment": datetime(2024, 1, 1),
+        "maturity_level": "Ad-hoc supply planning", "participants": ""})
+    template = dataframe_to_rows(frame, ASSESSMENT_COLUMNS)
+    country = ASSESSMENT_COLUMNS.index("country")
+    rows = [list(ASSESSMENT_COLUMNS)]
+    for i in range(-(-n_rows // len(template))):
+        for row in template:
+            row = list(row)
+            row[country] = f"Country {i}"
+            rows.append(row)
+    return rows[:n_rows + 1]
+
+
+def _submission(country, rng):
+    from dependencies import assessment_frame
+    from question_bank import QUESTION_BANK
+    codes = rng.integers(-1, 3, len(QUESTION_BANK.questions)).astype(np.int8)
+    return assessment_frame(codes, {}, {
+        "country": country, "assessors_name": "bench", "assessors_affiliation": "bench",
+        "period_of_review": "Q1 2024", "date_of_assessment": datetime.now(),
+        "maturity_level": "Ad-hoc supply planning", "participants": ""})
+
+
+def bench_submit(sizes, repeats, latency, rng):
+    """append_to_sheet, the duplicate check and cached reads against sheets of growing size."""
+    from dependencies import append_to_sheet, submission_exists
+    from sheet_cache import get_sheet_cache
+    results = {}
+    for n_rows in sizes:
+        sheet = FakeWorksheet(_sheet_rows(n_rows), latency=latency)
+        _use_sheet(sheet)
+        exists_cold = _timed(submission_exists, SHEET_NAME, "Country 0", "Q1 2024")
+        exists_warm = [_timed(submission_exists, SHEET_NAME, "Country 0", "Q1 2024") for _ in range(repeats)]
+        read_cold = _timed(get_sheet_cache().frame, SHEET_NAME)
+        read_warm = [_timed(get_sheet_cache().frame, SHEET_NAME) for _ in range(repeats)]
+        requests = sheet.requests
+        appends = [_timed(append_to_sheet, _submission(f"New {i}", rng), SHEET_NAME) for i in range(repeats)]
+        append_requests = (sheet.requests - requests) / repeats
+        # Only the appended rows are fetched
+        read_delta = _timed(get_sheet_cache().frame, SHEET_NAME)
+        upserts = [_timed(append_to_sheet, _submission("New 0", rng), SHEET_NAME, mode="upsert")
+                   for _ in range(repeats)]
+        full_read = _timed(sheet.get_all_records)
+        results[str(n_rows)] = {
+            "exists_cold_ms": round(1000 * exists_cold, 3),
+            "exists_warm": _summary(exists_warm),
+            "append": _summary(appends),
+            "append_requests": append_requests,
+            "read_cold_ms": round(1000 * read_cold, 3),
+            "read_warm": _summary(read_warm),
+            "read_delta_ms": round(1000 * read_delta, 3),
+            "upsert": _summary(upserts),
+            "get_all_records_ms": round(1000 * full_read, 3),
+            "rows_after": len(sheet.rows) - 1,
+        }
+    return results
+
+
+def bench_concurrency(assessors, latency, rng):
+    """N assessors filling in the form and submitting at the same time."""
+    from dependencies import countries, review_periods
+    sheet = FakeWorksheet(_sheet_rows(0), latency=latency)
+    _use_sheet(sheet)
+    sessions = []
+    for i in range(assessors):
+        at = _session(f"bench-concurrency-{i}")
+        at.run()
+        # Distinct (country, period) per assessor, so every submit is a new append
+        _fill(at, np.random.default_rng(i), countries[i % len(countries)],
+              review_periods[(i // len(countries)) % len(review_periods)])
+        at.run()
+        sessions.append(at)
+
+    timings = [None] * assessors
+    barrier = threading.Barrier(assessors)
+
+    def submit(i):
+        at = sessions[i]
+        barrier.wait()
+        timings[i] = _timed(at.button(key="submit_assessment_df").click().run)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(assessors)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    from question_bank import QUESTION_BANK
+    expected = sum(1 for at in sessions if at.success) * len(QUESTION_BANK.rows)
+    return {
+        "assessors": assessors,
+        "submit": _summary(timings),
+        "wall_ms": round(1000 * wall, 3),
+        "submissions_per_second": round(assessors / wall, 3),
+        "succeeded": sum(1 for at in sessions if at.success),
+        "rows_expected": expected,
+        "rows_written": len(sheet.rows) - 1,
+        "exceptions": sum(len(at.exception) for at in sessions),
+    }
+
+
+def _import_times(module):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.setdefault(name.strip(), int(cumulative) / 1000)
+    return times
+
+
+def bench_startup(repeats):
+    """Cold import of each app module and the first Home Page run, each in a new interpreter."""
+    imports = {module: [] for module in APP_MODULES}
+    loaded = {}
+    for _ in range(repeats):
+        for module in APP_MODULES:
+            times = _import_times(module)
+            imports[module].append(times.get(module, 0.0))
+            if module == "app":
+                loaded = {name: round(times[name], 3) for name in HEAVY_MODULES if name in times}
+    home = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", HOME_PAGE_SCRIPT, APP_PATH], capture_output=True,
+                                   text=True, cwd=os.path.dirname(APP_PATH))
+        home.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "import_ms": {module: round(statistics.median(ms), 3) for module, ms in imports.items()},
+        "app_import_loads": loaded,
+        "home_page": _summary([run["seconds"] for run in home]),
+        "home_page_loads": [name for name in HEAVY_MODULES if name in home[-1]["loaded"]],
+        "home_page_exceptions": home[-1]["exceptions"],
+    }
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP_PATH)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(suites=SUITES, sizes=(1000, 10000, 100000), changes=20, sessions=5, assessors=8, repeats=5,
+        latency=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        _configure_environment(workdir)
+        results = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "revision": _revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "api_latency_ms": 1000 * latency,
+            },
+        }
+        if "rerun" in suites:
+            results["rerun"] = bench_rerun(changes, rng)
+        if "memory" in suites:
+            results["memory"] = bench_memory(sessions, rng)
+        if "submit" in suites:
+            results["submit"] = bench_submit(sizes, repeats, latency, rng)
+        if "concurrency" in suites:
+            results["concurrency"] = bench_concurrency(assessors, latency, rng)
+        if "startup" in suites:
+            results["startup"] = bench_startup(repeats)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Data Entry rerun and submit paths.")
+    parser.add_argument("--only", action="append", choices=SUITES, help="Run only this suite (repeatable)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Sheet sizes in rows for the submit suite")
+    parser.add_argument("--changes", type=int, default=20, help="Radio changes timed by the rerun suite")
+    parser.add_argument("--sessions", type=int, default=5, help="Sessions measured by the memory suite")
+    parser.add_argument("--assessors", type=int, default=8, help="Concurrent assessors")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repetitions per submit measurement")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="Simulated Sheets API round trip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(suites=args.only or SUITES, sizes=[int(size) for size in args.sizes.split(",")],
+                  changes=args.changes, sessions=args.sessions, assessors=args.assessors,
+                  repeats=args.repeats, latency=args.api_latency_ms / 1000, seed=args.seed)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
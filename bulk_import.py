@@ -0,0 +1,179 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dependencies import QUESTION_BANK, countries, review_periods
+from question_bank import Question, encode_cells
+from scoring import get_scoring_engine
+from spool import assessment_exists, submit_assessment
+
+
+REQUIRED_COLUMNS = ["country", "assessors_name", "assessors_affiliation", "period_of_review"]
+OPTIONAL_COLUMNS = ["date_of_assessment", "participants"]
+
+
+def template_frame(bank=QUESTION_BANK):
+    # One row per assessment: metadata, one column per question key, one per comment box
+    columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS + [row.key for row in bank.rows]
+    return pd.DataFrame(columns=columns)
+
+
+def question_reference(bank=QUESTION_BANK):
+    return pd.DataFrame([
+        {"column": question.key, "section": question.section, "question": question.text,
+         "options": " | ".join(f"{i + 1}. {option}" for i, option in enumerate(question.options))}
+        for question in bank.questions
+    ] + [
+        {"column": section.comment.key, "section": section.title, "question": section.comment.text,
+         "options": "free text"}
+        for section in bank.sections
+    ])
+
+
+def read_workbook(file, filename):
+    if filename.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(file, dtype=object)
+    else:
+        df = pd.read_csv(file, dtype=object)
+    df.columns = [str(column).strip() for column in df.columns]
+    return df.map(lambda value: value.strip() if isinstance(value, str) else value)
+
+
+def validate_workbook(df, bank=QUESTION_BANK):
+    """Encode a workbook into a response matrix and list what is wrong with it.
+
+    Returns ``(codes, errors)`` where ``codes`` has one row per assessment and
+    one column per question, and ``errors`` is a list of (row, column, message)
+    with 1-based spreadsheet row numbers.
+    """
+    errors = []
+    missing = [column for column in REQUIRED_COLUMNS + [q.key for q in bank.questions] if column not in df.columns]
+    if missing:
+        return None, [(None, column, "Missing column") for column in missing]
+
+    for column in REQUIRED_COLUMNS:
+        for row in np.flatnonzero(df[column].isna() | (df[column].astype(str) == "")):
+            errors.append((int(row) + 2, column, "Required field is empty"))
+    for column, allowed in (("country", countries), ("period_of_review", review_periods)):
+        for row in np.flatnonzero(df[column].notna() & ~df[column].isin(allowed)):
+            errors.append((int(row) + 2, column, f"'{df[column].iloc[row]}' is not one of {allowed}"))
+    for row in np.flatnonzero(df.duplicated(subset=["country", "period_of_review"], keep=False)):
+        errors.append((int(row) + 2, "period_of_review", "Country and period appear more than once in the file"))
+
+    codes = np.empty((len(df), len(bank.questions)), dtype=np.int8)
+    for question in bank.questions:
+        column = encode_cells(question, df[question.key].tolist())
+        for row in np.flatnonzero(column == -2):
+            errors.append((int(row) + 2, question.key, f"'{df[question.key].iloc[row]}' is not an option of this question"))
+        codes[:, question.position] = column
+    return codes, errors
+
+
+def workbook_to_frame(df, codes, bank=QUESTION_BANK):
+    """Flat submission rows for every assessment of the workbook.
+
+    Scores and maturity levels are computed for all assessments at once; the
+    result has the same columns as a Data Entry submission.
+    """
+    n_assessments, n_rows = len(df), len(bank.rows)
+    engine = get_scoring_engine()
+    scores = engine.question_scores(codes)
+    totals = engine.total(codes)
+
+    answers = np.empty((n_assessments, n_rows), dtype=object)
+    row_scores = np.full((n_assessments, n_rows), np.nan)
+    for i, row in enumerate(bank.rows):
+        if isinstance(row, Question):
+            options = np.array(row.options + (None,), dtype=object)
+            # -1 (unanswered) picks the trailing None
+            answers[:, i] = options[codes[:, row.position]]
+            row_scores[:, i] = scores[:, row.position]
+        else:
+            answers[:, i] = df[row.key].where(df[row.key].notna(), "").to_numpy() if row.key in df else ""
+
+    now = datetime.now()
+    frame = pd.DataFrame({
+        "questions": np.tile(bank.row_texts, n_assessments),
+        "answer": answers.ravel(),
+        "score": row_scores.ravel(),
+    })
+    for column in REQUIRED_COLUMNS:
+        frame[column] = np.repeat(df[column].astype(str).to_numpy(), n_rows)
+    if "date_of_assessment" in df:
+        dates = pd.to_datetime(df["date_of_assessment"], errors="coerce").fillna(now)
+    else:
+        dates = pd.Series([now] * n_assessments)
+    frame["date_of_assessment"] = np.repeat(dates.to_numpy(), n_rows)
+    frame["section"] = np.tile([row.section for row in bank.rows], n_assessments)
+    frame["maturity_level"] = np.repeat(engine.levels(totals), n_rows)
+    if "participants" in df:
+        participants = df["participants"].where(df["participants"].notna(), "").to_numpy()
+    else:
+        participants = np.full(n_assessments, "", dtype=object)
+    frame["participants"] = np.repeat(participants, n_rows)
+    frame["instrument_version"] = bank.version
+    return frame, totals
+
+
+def bulk_import_page():
+    st.divider()
+    st.subheader("Bulk Import")
+    st.write("Upload a CSV or Excel workbook with one row per paper-based assessment. "
+             "Answer cells may hold the option text or its number (1, 2 or 3).")
+
+    template = io.StringIO()
+    template_frame().to_csv(template, index=False)
+    st.download_button("Download template", template.getvalue(), file_name="icsps_bulk_import_template.csv",
+                       mime="text/csv")
+    with st.expander("Question columns"):
+        st.dataframe(question_reference(), hide_index=True)
+
+    upload = st.file_uploader("Workbook", type=["csv", "xlsx", "xls"])
+    if upload is None:
+        return
+
+    try:
+        df = read_workbook(upload, upload.name)
+    except Exception as e:
+        print(e)
+        st.error("Could not read the workbook")
+        return
+
+    codes, errors = validate_workbook(df)
+    if errors:
+        st.error(f"{len(errors)} problem(s) found; nothing was imported")
+        st.dataframe(pd.DataFrame(errors, columns=["row", "column", "problem"]), hide_index=True)
+        return
+
+    all_data, totals = workbook_to_frame(df, codes)
+    summary = df[["country", "period_of_review"]].copy()
+    summary["total_score"] = totals
+    summary["maturity_level"] = get_scoring_engine().levels(totals)
+    summary["already_submitted"] = [assessment_exists(country, period) for country, period
+                                    in zip(summary["country"], summary["period_of_review"])]
+    st.dataframe(summary, hide_index=True)
+
+    replace_existing = False
+    if summary["already_submitted"].any():
+        replace_existing = st.checkbox("Replace assessments that were already submitted", key="bulk_replace")
+
+    if st.button(label="Import", key="bulk_import_submit", type="primary"):
+        existing = set(zip(summary.loc[summary["already_submitted"], "country"],
+                           summary.loc[summary["already_submitted"], "period_of_review"]))
+        is_existing = pd.Series(list(zip(all_data["country"], all_data["period_of_review"]))).isin(existing).to_numpy()
+        try:
+            if (~is_existing).any():
+                # Every new assessment goes out in one batched write
+                submit_assessment(all_data[~is_existing], mode="append")
+            if replace_existing:
+                for _, block in all_data[is_existing].groupby(["country", "period_of_review"], sort=False):
+                    submit_assessment(block, mode="upsert")
+        except Exception as e:
+            print(e)
+            st.error("Could not save Data")
+        else:
+            imported = len(summary) if replace_existing else int((~summary["already_submitted"]).sum())
+            st.success(f"Imported {imported} assessment(s)!🔔")
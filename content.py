@@ -0,0 +1,86 @@
+"""Home Page text and logo.
+
+Kept apart from dependencies so the Home Page renders without loading
+pandas, the storage backends or the Google Sheets client.
+"""
+import io
+import os
+
+import streamlit as st
+from PIL import Image
+from dotenv import load_dotenv
+
+
+load_dotenv()
+project_sections = [
+    "FSP Policies, Commitment & Political Will",
+    "Data",
+    "Analysis",
+    "Forecasting and Supply Planning Activities",
+    "Funding and Adjustments of Forecasts and Supply Plans",
+    "Gender, equity and social inclusion (GESI)"
+]
+
+
+purpose = """
+This tool assesses a country's vaccine forecasting and supply planning maturity. To be effective,
+immunization forecasting and supply planning must be proactive rather than reactive. The tool looks at
+various characteristics in five broad categories for effective forecasting and supply planning:
+● FSP Policies, Commitment, and Political Will
+● Data
+● Analysis
+● Forecasting and Supply Planning Activities
+● Funding and Adjustments of Forecasts and Supply Plans.
+● Gender, equity and social inclusion (GESI)
+These characteristics holistically contribute to strengthening the forecasting and supply planning practices
+through the collaborative efforts of all relevant stakeholders in-country, thus achieving the desired state of
+proactive forecasting and supply planning. The assessment results map countries into 3 phases: ad-hoc
+forecasting and supply planning, reactive forecasting and supply planning, and proactive forecasting and
+supply planning, with the last being the ideal. Routine monitoring of vaccines by countries ensures that
+countries maintain adequate stocks of vaccines, align demand for vaccines with supply, and minimize
+stockouts or the need to destroy vaccines due to expiries.
+The tool also considers gender, equity and social inclusion (GESI), which refers to the intentional
+consideration of how different groups—such as women, men, adolescents, people with disabilities, and those
+in remote or underserved areas—experience access to health services, including immunization. In the context
+of FSP, integrating a GESI lens does not expand the technical mandate of FSP, which remains focused on
+estimating vaccine needs and planning for timely and adequate supply. Rather, it strengthens the quality and
+responsiveness of FSP by improving the accuracy of assumptions, supporting equity-aware adjustments, and
+helping ensure no population is left behind. GESI integration in FSP includes the use of disaggregated data
+(e.g., by sex, age, geography) where available, meaningful coordination with technical GESI expertise to inform
+planning, and intentional efforts to ensure diverse representation within FSP teams. These components help
+ensure that forecasts and supply plans are based on a realistic understanding of who is being reached, who is
+not, and why—without asking FSP teams to lead or fund service delivery or outreach efforts. Instead, GESI
+integration enables FSP to better align with broader equity goals while staying fully within its technical scope.
+"""
+
+instructions = """
+The tool will be completed by country EPI teams participating in the ICSPS initiative. 
+For each of the questions, please select the answer that best describes the status in the country, particularly the EPI Team, the National Logistics Working Group for Immunization, or any other task force/body in the country that is responsible for supply and demand planning for vaccines within the country.  
+If you have any key comments, please provide them in the sections at the bottom of each category in the tool.
+The assessment will be completed every quarter to show progress over time. The assessment results will help countries pinpoint and prioritize areas needing improvement. Then, teams will use these findings to create action plans for implementation
+"""
+
+default_response_note = "Before you proceed to fill out this digital tool, ensure to first complete a paper-based version. Only input data into the digital tool once the team has collectively agreed upon the responses."
+
+
+LOGO_PATH = "www/combined_logos_1.png"
+# Width the logo strip is displayed at; the image is resized to it once
+LOGO_WIDTH = 700
+
+
+# Cached across sessions; the file modification time is part of the key
+@st.cache_resource(show_spinner=False)
+def _resized_logo(path, width, mtime):
+    image = Image.open(path)
+    height = round(image.height * width / image.width)
+    buffer = io.BytesIO()
+    image.resize((width, height), Image.LANCZOS).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def logo_bytes(path=LOGO_PATH, width=LOGO_WIDTH):
+    return _resized_logo(path, width, os.path.getmtime(path))
+
+
+def project_sections_markdown():
+    return "\n".join(f"- {item}" for item in project_sections)
@@ -0,0 +1,76 @@
+import pandas as pd
+import streamlit as st
+
+from aggregates import get_aggregate_store
+from dependencies import QUESTION_BANK, period_sort_key, review_periods
+from scoring import get_scoring_engine
+from storage import get_storage
+
+
+def section_max_scores():
+    engine = get_scoring_engine()
+    return dict(zip(engine.section_titles, engine.section_max))
+
+
+def ordered_periods(periods):
+    return sorted(set(periods) | set(review_periods), key=period_sort_key)
+
+
+def dashboard_page():
+    st.divider()
+    st.subheader("Dashboard")
+    store = get_aggregate_store()
+    totals = store.submission_totals()
+
+    with st.expander("Maintenance"):
+        engine = get_scoring_engine()
+        st.write("Aggregates are updated on every submit. Rebuild them after importing data outside the app "
+                 f"or changing the scoring methodology (current: {engine.version}, {engine.normalization}).")
+        if st.button(label="Rebuild from stored data", key="rebuild_aggregates"):
+            try:
+                rows = get_storage().read()
+                if not rows.empty:
+                    # Scores and levels are re-derived with the current methodology
+                    rows, _ = engine.regrade(rows)
+                skipped = store.rebuild(rows)
+            except Exception as e:
+                print(e)
+                st.error("Could not rebuild the aggregates")
+            else:
+                if skipped:
+                    st.session_state["rebuild_feedback"] = (
+                        f"{skipped} stored row(s) were skipped: their question is not in instrument "
+                        f"{engine.bank.version}.")
+                st.rerun()
+        if "rebuild_feedback" in st.session_state:
+            st.warning(st.session_state.pop("rebuild_feedback"))
+
+    if totals.empty:
+        st.info("No assessments have been stored yet.")
+        return
+
+    all_countries = sorted(totals["country"].unique())
+    selected_countries = st.multiselect("Countries", all_countries, default=all_countries)
+    totals = totals[totals["country"].isin(selected_countries)]
+    periods = [p for p in ordered_periods(totals["period_of_review"]) if p in set(totals["period_of_review"])]
+
+    st.markdown("### Total maturity score")
+    st.line_chart(totals.pivot(index="period_of_review", columns="country", values="total_score")
+                  .reindex(periods))
+
+    st.markdown("### Maturity level")
+    st.dataframe(totals.pivot(index="country", columns="period_of_review", values="maturity_level")
+                 .reindex(columns=periods))
+
+    st.markdown("### Section scores")
+    if not periods:
+        return
+    period = st.selectbox("Period of Review", periods, index=len(periods) - 1, key="dashboard_period")
+    sections = store.section_scores()
+    sections = sections[sections["country"].isin(selected_countries) & (sections["period_of_review"] == period)]
+    maximum = pd.Series(section_max_scores())
+    sections["percent_of_max"] = (100 * sections["score"] / sections["section"].map(maximum)).round(1)
+    section_order = [section.title for section in QUESTION_BANK.sections]
+    table = sections.pivot(index="section", columns="country", values="percent_of_max").reindex(section_order)
+    st.bar_chart(table, horizontal=True)
+    st.dataframe(table)
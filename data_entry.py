@@ -0,0 +1,179 @@
+from datetime import datetime
+
+import streamlit as st
+
+from dependencies import (
+    section_fragment, response_state, sync_response_state, current_assessment_frame,
+    restore_draft, save_draft, discard_draft, pending_appends,
+    previous_period, prefill_answers, prefill_changes,
+    QUESTION_BANK, countries, review_periods,)
+from spool import get_spool, write_behind_enabled, submit_assessment, assessment_exists
+from scoring import determine_maturity_level
+from modal import replace_modal, confirm_replace
+from sheets import get_connection
+from telemetry import span, timed
+
+
+def score_header(header):
+    # Drawn into a placeholder so the section fragments can redraw it in place
+    with header.container():
+        if st.session_state.get("prefill_source"):
+            source = " ".join(st.session_state["prefill_source"])
+            try:
+                changes = prefill_changes()
+            except Exception as e:
+                print(e)
+                st.error(f"Could not compare with {source}")
+            else:
+                with st.expander(f"Changed since {source}: {len(changes)} answer(s)"):
+                    st.dataframe(changes, hide_index=True)
+
+        # Kept incrementally by the radio callbacks, no frame is needed for it
+        total_score = response_state()["total_score"]
+        st.markdown("### Your maturity level is:")
+        st.markdown(f"#### {determine_maturity_level(total_score)}")
+        st.metric(label="Total Maturity Score", value=total_score)
+
+
+@timed("submit")
+def save_submission(all_data, mode):
+    try:
+        submit_assessment(all_data, mode=mode)
+    except Exception as e:
+        print(e)
+        st.error("Could not save Data")
+        return False
+    print("Successfully submitted!🔔")
+    return True
+
+
+def data_entry_page():
+    st.divider()
+    # Answers autosaved before a reload or dropped connection come back here
+    draft = restore_draft(select_keys=("country_name", "period_of_review"))
+    if draft:
+        st.info(f"Restored {len(draft)} answers from your unsubmitted draft.")
+        if st.button(label="Discard draft", key="discard_draft"):
+            discard_draft(clear_form=True)
+            st.rerun()
+    sync_response_state()
+
+    st.subheader("Required fields")
+    country_name = st.selectbox(
+        "Name of Country being assessed", countries, placeholder="Choose country",
+        index=countries.index(draft["country_name"]) if draft.get("country_name") in countries else 0,
+        key="country_name", on_change=save_draft, args=("country_name",))
+    assessors_name = st.text_input(
+        "Name", placeholder="Enter your name", key="assessors_name", on_change=save_draft, args=("assessors_name",))
+    assessors_affiliation = st.text_input(
+        "Organization", placeholder="Enter your organization's name",
+        key="assessors_affiliation", on_change=save_draft, args=("assessors_affiliation",)
+    )
+    period_of_review = st.selectbox(
+        "Period of Review", review_periods, placeholder="Choose the period of review",
+        index=review_periods.index(draft["period_of_review"]) if draft.get("period_of_review") in review_periods else 0,
+        key="period_of_review", on_change=save_draft, args=("period_of_review",))
+    date_of_assessment = datetime.now()
+
+    # Most answers rarely change between quarters: start from the last ones
+    previous = previous_period(country_name, period_of_review)
+    if previous and st.session_state.get("prefill_source") != [country_name, previous]:
+        st.button(label=f"Prefill answers from {country_name} {previous}", key="prefill_previous",
+                  on_click=prefill_answers, args=(country_name, previous),
+                  help="Replaces the answers below with those of the previous assessment")
+
+    st.divider()
+
+    # Filled in further down, once the score header the sections redraw exists
+    sections_area = st.container()
+
+    with st.expander("Participants List"):
+        participants_list = st.text_area(
+            " ", placeholder="Please fill the name of each person and their organisation in brackets separated with a comma. e.g. Jane Doe (JSI), John Doe (CHAI)",
+            key="participants", on_change=save_draft, args=("participants",)
+        )
+
+    def build_all_data():
+        with span("assemble_frame"):
+            all_data = current_assessment_frame({
+                "country": country_name,
+                "assessors_name": assessors_name,
+                "assessors_affiliation": assessors_affiliation,
+                "period_of_review": period_of_review,
+                "date_of_assessment": date_of_assessment,
+            })
+            all_data["maturity_level"] = determine_maturity_level(response_state()["total_score"])
+            all_data["participants"] = participants_list
+        return all_data
+
+    st.divider()
+    with st.expander("View Results Table"):
+        # The table is only assembled when asked for
+        if st.toggle("Show results table", key="show_results_table"):
+            st.dataframe(build_all_data(), hide_index=True)
+
+    header = st.empty()
+    full_run = True
+
+    def refresh_header():
+        # A fragment must write to the header once in a full run to be allowed
+        # to redraw it on its own reruns; here it only claims it
+        if full_run:
+            header.empty()
+        else:
+            score_header(header)
+
+    with sections_area:
+        # A radio click reruns only its section's fragment and the header
+        for section in QUESTION_BANK.sections:
+            section_fragment(section, refresh_header)
+    full_run = False
+    score_header(header)
+
+    submit_data = st.button(
+        label="Submit", key="submit_assessment_df", type="primary")
+
+    validate_data = [country_name, assessors_name,
+                     assessors_affiliation, period_of_review]
+    if "submit_feedback" in st.session_state:
+        st.success(st.session_state.pop("submit_feedback"))
+    if "submit_error" in st.session_state:
+        st.error(st.session_state.pop("submit_error"))
+
+    if submit_data:
+        if any(not item for item in validate_data):
+            st.error("Required fields cannot be Empty")
+        elif assessment_exists(country_name, period_of_review):
+            replace_modal.open()
+        elif save_submission(build_all_data(), mode="append"):
+            discard_draft()
+            st.success("Successfully submitted!🔔")
+
+    if replace_modal.is_open():
+        replace = confirm_replace(country_name, period_of_review)
+        if replace:
+            # Closing the prompt reruns the page, so the outcome is shown after it
+            if save_submission(build_all_data(), mode="upsert"):
+                discard_draft()
+                st.session_state["submit_feedback"] = "Successfully replaced!🔔"
+            else:
+                st.session_state["submit_error"] = "Could not save Data"
+        if replace is not None:
+            replace_modal.close()
+
+    if write_behind_enabled():
+        with st.expander("Submission Queue"):
+            queue_status = get_spool().status()
+            col1, col2, col3 = st.columns(3)
+            col1.metric(label="Pending", value=queue_status["pending"])
+            col2.metric(label="Failed", value=queue_status["failed"])
+            col3.metric(label="Sent", value=queue_status["sent"])
+            if not queue_status["items"].empty:
+                st.dataframe(queue_status["items"], hide_index=True)
+            if queue_status["failed"] and st.button(label="Retry failed submissions", key="retry_failed"):
+                get_spool().retry_failed()
+                st.rerun()
+            throttle = get_connection().throttle_status()
+            st.caption(f"Google Sheets API: {pending_appends()} submission(s) waiting to be appended, "
+                       f"{throttle['reads']['waiting']} read(s) and {throttle['writes']['waiting']} write(s) "
+                       "waiting for quota")
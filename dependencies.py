@@ -1,660 +1,561 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
-import os
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread_dataframe import set_with_dataframe
-from google.oauth2 import service_account
-from dotenv import load_dotenv
-
-
-load_dotenv()
-project_sections = [
-    "FSP Policies, Commitment & Political Will",
-    "Data",
-    "Analysis",
-    "Forecasting and Supply Planning Activities",
-    "Funding and Adjustments of Forecasts and Supply Plans",
-    "Gender, equity and social inclusion (GESI)"
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from content import purpose, instructions
+from sheets import get_connection, is_not_found
+from drafts import get_draft_store
+from sheet_cache import get_sheet_cache
+from telemetry import span, timed
+from question_bank import QUESTION_BANK, Question, migrate_ids
+from scoring import get_scoring_engine
+from aggregates import get_aggregate_store
+
+
+SECTION_INDEX = {section.id: s for s, section in enumerate(QUESTION_BANK.sections)}
+
+
+def response_state():
+    """Answers of the current session as fixed-size arrays.
+
+    ``response_codes`` holds the option index of every question (-1 when
+    unanswered), ``response_scores`` the weighted question scores,
+    ``section_scores`` their sums per section and ``total_score`` the
+    methodology total, kept up to date by the radio callbacks and rebuilt
+    from the radios by ``sync_response_state`` on every full run.
+    """
+    state = st.session_state
+    if "response_codes" not in state:
+        codes = np.full(len(QUESTION_BANK.questions), -1, dtype=np.int8)
+        for question in QUESTION_BANK.questions:
+            code = state.get(question.key)
+            if code is not None:
+                codes[question.position] = code
+        state["response_codes"] = codes
+        engine = get_scoring_engine()
+        state["response_scores"] = engine.question_scores(codes)
+        state["section_scores"] = state["response_scores"] @ engine.membership
+        state["total_score"] = float(engine.total(codes))
+    return state
+
+
+def sync_response_state():
+    # Streamlit drops the radios' state while another page is shown, so the
+    # arrays are rebuilt from the widget keys instead of trusting the last run
+    st.session_state.pop("response_codes", None)
+    return response_state()
+
+
+@timed("calculate_score", recent=False)
+def _record_answer(question):
+    # Only the changed answer is re-scored; the total is linear in the option
+    # points, so it moves by the difference times the question's coefficient
+    state = response_state()
+    engine = get_scoring_engine()
+    code = state.get(question.key)
+    code = -1 if code is None else code
+    previous = state["response_codes"][question.position]
+    state["response_codes"][question.position] = code
+    state["total_score"] += engine.total_coefficients[question.position] * (
+        engine.points(code) - engine.points(previous))
+    score = engine.question_weights[question.position] * engine.points(code)
+    state["section_scores"] += engine.membership[question.position] * (score - state["response_scores"][question.position])
+    state["response_scores"][question.position] = score
+    save_draft(question.key)
+
+
+def draft_id():
+    # Kept in the URL, so a reloaded tab or a new session after a dropped
+    # connection finds the same draft
+    draft = st.query_params.get("draft")
+    if not draft:
+        draft = uuid.uuid4().hex
+        st.query_params["draft"] = draft
+    return draft
+
+
+def restore_draft(select_keys=()):
+    """Answers autosaved for this tab, put back into the session once.
+
+    Radios, comment boxes and text fields are restored through their keys;
+    the selectboxes named in ``select_keys`` have a default index, so they
+    read their saved value from the returned dict instead.
+    """
+    state = st.session_state
+    if "draft_restored" not in state:
+        try:
+            saved = get_draft_store().load(draft_id())
+        except Exception as e:
+            print(e)
+            saved = {}
+        questions = {question.key: question for question in QUESTION_BANK.questions}
+        for key, value in saved.items():
+            question = questions.get(key)
+            # Skip answers the current instrument can no longer show
+            if key in state or key in select_keys or (question and value not in question.option_indices):
+                continue
+            state[key] = value
+        state["draft_restored"] = saved
+    return state["draft_restored"]
+
+
+def save_draft(key):
+    # One small row per changed widget; a failed autosave must not break the form
+    try:
+        get_draft_store().save(draft_id(), key, st.session_state.get(key))
+    except Exception as e:
+        print(e)
+
+
+def discard_draft(clear_form=False):
+    try:
+        get_draft_store().discard(draft_id())
+    except Exception as e:
+        print(e)
+    if clear_form:
+        state = st.session_state
+        for key in [*state.get("draft_restored", {}), *(q.key for q in QUESTION_BANK.questions),
+                    *(s.comment.key for s in QUESTION_BANK.sections), "response_codes", "prefill_source"]:
+            state.pop(key, None)
+        state["draft_restored"] = {}
+
+
+def render_section(section):
+    with span("render_section", section=section.id):
+        state = response_state()
+        s = SECTION_INDEX[section.id]
+        st.caption(f"Section score: {state['section_scores'][s]:g} of {get_scoring_engine().section_max[s]:g}")
+        for question in section.questions:
+            st.subheader(question.text)
+            # The radio holds the option index; the text is only used for display
+            st.radio(question.prompt, question.option_indices, format_func=question.options.__getitem__,
+                     key=question.key, index=None, on_change=_record_answer, args=(question,))
+
+        st.subheader(section.comment.text)
+        st.text_area(section.comment.prompt, key=section.comment.key, on_change=save_draft, args=(section.comment.key,))
+
+
+@st.fragment
+def section_fragment(section, refresh_header):
+    """One section expander as a fragment: an answer reruns only this
+    section, then ``refresh_header`` redraws the totals in place."""
+    with st.expander(section.title):
+        render_section(section)
+    refresh_header()
+
+
+def assessment_frame(codes, comments, metadata, bank=QUESTION_BANK):
+    """Build the flat submission table (one row per question/comment box).
+
+    ``codes`` is a response vector, ``comments`` maps comment keys to text and
+    ``metadata`` holds the per-submission columns repeated on every row.
+    """
+    scores = get_scoring_engine().question_scores(codes)
+    texts, answers, row_scores, sections = [], [], [], []
+    for row in bank.rows:
+        texts.append(row.text)
+        sections.append(row.section)
+        if isinstance(row, Question):
+            code = codes[row.position]
+            answers.append(row.options[code] if code >= 0 else None)
+            row_scores.append(scores[row.position])
+        else:
+            answers.append(comments.get(row.key, ""))
+            row_scores.append(None)
+    df = pd.DataFrame({"questions": texts, "answer": answers, "score": row_scores})
+    for column, value in metadata.items():
+        df[column] = value
+    df["section"] = sections
+    df["instrument_version"] = bank.version
+    return df
+
+
+def current_assessment_frame(metadata):
+    state = response_state()
+    comments = {section.comment.key: state.get(section.comment.key, "") for section in QUESTION_BANK.sections}
+    return assessment_frame(state["response_codes"], comments, metadata)
+
+
+countries = [
+    "Nigeria", "Democratic Republic of the Congo",
+    "Ethiopia", "Mozambique"
 ]
 
 
-purpose = """
-This tool assesses a country's vaccine forecasting and supply planning maturity. To be effective,
-immunization forecasting and supply planning must be proactive rather than reactive. The tool looks at
-various characteristics in five broad categories for effective forecasting and supply planning:
-● FSP Policies, Commitment, and Political Will
-● Data
-● Analysis
-● Forecasting and Supply Planning Activities
-● Funding and Adjustments of Forecasts and Supply Plans.
-● Gender, equity and social inclusion (GESI)
-These characteristics holistically contribute to strengthening the forecasting and supply planning practices
-through the collaborative efforts of all relevant stakeholders in-country, thus achieving the desired state of
-proactive forecasting and supply planning. The assessment results map countries into 3 phases: ad-hoc
-forecasting and supply planning, reactive forecasting and supply planning, and proactive forecasting and
-supply planning, with the last being the ideal. Routine monitoring of vaccines by countries ensures that
-countries maintain adequate stocks of vaccines, align demand for vaccines with supply, and minimize
-stockouts or the need to destroy vaccines due to expiries.
-The tool also considers gender, equity and social inclusion (GESI), which refers to the intentional
-consideration of how different groups—such as women, men, adolescents, people with disabilities, and those
-in remote or underserved areas—experience access to health services, including immunization. In the context
-of FSP, integrating a GESI lens does not expand the technical mandate of FSP, which remains focused on
-estimating vaccine needs and planning for timely and adequate supply. Rather, it strengthens the quality and
-responsiveness of FSP by improving the accuracy of assumptions, supporting equity-aware adjustments, and
-helping ensure no population is left behind. GESI integration in FSP includes the use of disaggregated data
-(e.g., by sex, age, geography) where available, meaningful coordination with technical GESI expertise to inform
-planning, and intentional efforts to ensure diverse representation within FSP teams. These components help
-ensure that forecasts and supply plans are based on a realistic understanding of who is being reached, who is
-not, and why—without asking FSP teams to lead or fund service delivery or outreach efforts. Instead, GESI
-integration enables FSP to better align with broader equity goals while staying fully within its technical scope.
-"""
-
-instructions = """
-The tool will be completed by country EPI teams participating in the ICSPS initiative. 
-For each of the questions, please select the answer that best describes the status in the country, particularly the EPI Team, the National Logistics Working Group for Immunization, or any other task force/body in the country that is responsible for supply and demand planning for vaccines within the country.  
-If you have any key comments, please provide them in the sections at the bottom of each category in the tool.
-The assessment will be completed every quarter to show progress over time. The assessment results will help countries pinpoint and prioritize areas needing improvement. Then, teams will use these findings to create action plans for implementation
-"""
-
-default_response_note = "Before you proceed to fill out this digital tool, ensure to first complete a paper-based version. Only input data into the digital tool once the team has collectively agreed upon the responses."
-
-
-questions = [
-    "There is a multidisciplinary team responsible for forecasting and supply planning for vaccines. This can be any working group or unit responsible for FSP in the MOH",
-    "Inclusion of all relevant stakeholders in forecasting and supply planning for vaccines in the country",
-    "Existence of work plans, MoUs, or TORs for vaccine forecasting and supply planning (stand-alone or anchored on other documents)",
-    "The TOR covers the following key FSP functions and responsibilities listed; i) developing work plans, ii) organizing and completing FSP preparatory activities, iii) developing a forecast and supply plan, iv) ensuring FSP monitoring and implementation of a continuous improvement plan, v) leading standardization of FSP processes and training of members, vi) liaising with and leveraging skills and expertise available in other program areas to ensure alignment and integration; and, vii) supporting other innovative activities such as new vaccine introduction",
-    "The EPI program has a supply chain strategy that covers the following key technical areas of FSP; Preparatory activities for FSP (e.g. gathering and ratifying data assumptions and consultation meetings or workshops), Forecasting, Supply Planning, Pipeline Monitoring, and FSP performance monitoring",
-    "Commitment from the relevant stakeholders toward forecasting and supply planning for vaccines",
-    "Resources allocated for forecasting and supply planning-related tasks",
-    "FSP Policies, Commitment & Political Will Comments",
-    "Presence of a reliable system for collecting disaggregated data",
-    "Access to relevant, quality, and disaggregated data (consumption data by product, dose and month, wastages - open and closed vial wastage, adjustments, expiries, etc.)",
-    "Accuracy of stock balances",
-    "Data reporting practices (timeliness of reporting)",
-    "Standardized tools for forecasting and supply planning are routinely used",
-    "Data Comments",
-    "Stock status is routinely assessed",
-    "Methodology used for forecasting vaccines",
-    "Data from the lowest level (e.g., regions, districts, facilities) is used to develop the national forecast and supply plan",
-    "Triangulation of data from different sources when developing national forecasts, e.g. EPI forecasting tool, stock management tool (SMT), District Vaccine Data Management Tool (DVD/MT), District Health Information System 2 (DHIS2), ViVa e.t.c",
-    "Calculate and update forecasts based on updated data and discussions with stakeholders",
-    "Forecasts and supply plans developed (determination of what needs to be ordered by whom and when)",
-    "Forecasting and supply plan report (or supply plan) covers key components of the quantification report (or supply plan), i.e. Forecasting assumptions and considerations, Forecasted quantities, Quantities required to fill the supply pipeline, funding requirement/costs, shipment schedules, including specific lead times where applicable",
-    "Conduct scenario monitoring",
-    "Ability to estimate the potential for vaccine expiry",
-    "Analysis Comments",
-    "Forecasting and supply planning activities included in the EPI work plans",
-    "Forecasting and supply planning activities are inclusive of all relevant stakeholders (including implementing partners and donors)",
-    "Regular and routine supply planning meetings scheduled and held  (ideally quarterly at minimum)",
-    "Forecasting and supply planning meetings review previous actions and recommendations",
-    "Flexible to convene ad-hoc meetings to respond to emerging supply planning (SP) needs",
-    "Decisions made in a timely and well-coordinated manner",
-    "Decisions are based on evidence",
-    "Meetings address supply planning risks",
-    "Forecasting and Supply Planning Activities Comments",
-    "Results of forecasting and supply planning reports are communicated to all relevant stakeholders",
-    "Recommended adjustments are communicated to all relevant stakeholders",
-    "Recommended adjustments are made in a timely and complete fashion",
-    "Funding is available in a timely manner for total commodity requirement",
-    "Funding and Adjustments of Forecasts and Supply Plans Comments",
-    "Relevant stakeholders, including GESI experts, are included in the FSP process to ensure decisions reflect the needs of all population groups.",
-    "FSP team is diverse, gender-balanced, and socially inclusive.",
-    "GESI is integrated into FSP plans, MoUs, or TORs, with alignment to equity strategies and use of disaggregated data.",
-    "Availability of data disaggregated by sex, age, and geographic location",
-    "Forecasting methodology includes efforts to reach underserved populations and supports equitable supply planning.",
-    "Supply chain risks for underserved populations are routinely reviewed during supply plan monitoring.",
-    "Funding supports supply plan adjustments, including those addressing equity and underserved populations.",
-    "Gender Equity and Social Inclusion Comments"
+review_periods = [
+    "Q1 2024", "Q2 2024", "Q3 2024", "Q4 2024","Q1 2025", "Q2 2025", "Q3 2025","Q4 2025"
 ]
 
 
+def period_sort_key(period):
+    # "Q3 2024" -> (2024, 3); unknown labels go last
+    try:
+        quarter, year = period.split()
+        return int(year), int(quarter.lstrip("Q"))
+    except ValueError:
+        return 9999, 0
+
+
+def previous_period(country, period_of_review):
+    # Latest period before this one with stored answers for the country
+    try:
+        periods = get_aggregate_store().answered_periods(country)
+    except Exception as e:
+        print(e)
+        return None
+    earlier = [p for p in periods if period_sort_key(p) < period_sort_key(period_of_review)]
+    return max(earlier, key=period_sort_key) if earlier else None
+
+
+def stored_answers(country, period_of_review, bank=QUESTION_BANK):
+    """Stored answers of a submission as (response codes, comments by key),
+    translated to ``bank`` if they were recorded with an earlier instrument."""
+    answers = get_aggregate_store().answers(country, period_of_review)
+    codes = np.full(len(bank.questions), -1, dtype=np.int8)
+    comments = {}
+    for version, rows in answers.groupby("instrument_version"):
+        question_ids, option_ids = migrate_ids(bank, version, rows["question_id"], rows["option_code"])
+        for question_id, option_id, text in zip(question_ids, option_ids, rows["text"]):
+            row = bank.by_id.get(question_id)
+            if isinstance(row, Question):
+                if option_id in row.option_ids:
+                    codes[row.position] = row.option_ids.index(option_id)
+            elif row is not None:
+                comments[row.key] = text or ""
+    return codes, comments
+
+
+def prefill_answers(country, period_of_review):
+    """Button callback: fill the form with the answers of ``period_of_review``."""
+    try:
+        codes, comments = stored_answers(country, period_of_review)
+    except Exception as e:
+        print(e)
+        return
+    state = st.session_state
+    values = {}
+    for question in QUESTION_BANK.questions:
+        code = codes[question.position]
+        values[question.key] = int(code) if code >= 0 else None
+    for section in QUESTION_BANK.sections:
+        values[section.comment.key] = comments.get(section.comment.key, "")
+    values["prefill_source"] = [country, period_of_review]
+    state.update(values)
+    # Rebuilt from the widget keys on the next response_state()
+    state.pop("response_codes", None)
+    try:
+        get_draft_store().save_many(draft_id(), values)
+    except Exception as e:
+        print(e)
+
+
+def prefill_changes():
+    """Answers changed since the prefilled submission, one row per question or comment box."""
+    country, period = st.session_state["prefill_source"]
+    codes, comments = stored_answers(country, period)
+    state = response_state()
+    current = state["response_codes"]
+    changes = []
+    for position in np.flatnonzero(current != codes):
+        question = QUESTION_BANK.questions[position]
+        changes.append({"question": question.text,
+                        period: question.options[codes[position]] if codes[position] >= 0 else "",
+                        "now": question.options[current[position]] if current[position] >= 0 else ""})
+    for section in QUESTION_BANK.sections:
+        key = section.comment.key
+        if (state.get(key) or "") != comments.get(key, ""):
+            changes.append({"question": section.comment.text, period: comments.get(key, ""), "now": state.get(key) or ""})
+    return pd.DataFrame(changes, columns=["question", period, "now"])
 
-questions_df = pd.DataFrame(questions, columns=["questions"])
-
-
-def calculate_score(options, answer):
-    return options.index(answer) + 1 if answer else 0
-
-
-def fsp_policies_section():
-    st.subheader(questions[0])
-    team_options = [
-        "Absence of a team responsible for forecasting and supply planning for vaccines",
-        "Forecasting and supply planning for vaccines is the responsibility of a few individuals within the MOH",
-        "There is a multidisciplinary team that is tasked with the responsibility of forecasting and supply planning for vaccines"
-    ]
-    team_status = st.radio("Select team status:",
-                           team_options, key="1", index=None)
-
-    st.subheader(questions[1])
-    stakeholders_options = [
-        "Relevant stakeholders not included",
-        "Limited inclusion of stakeholders",
-        "All relevant stakeholders included"
-    ]
-    stakeholders_status = st.radio(
-        "Select stakeholders inclusion status:", stakeholders_options, key="2", index=None)
-
-    st.subheader(questions[2])
-    plans_options = [
-        "Absence of ToR, MoU, or work plans for vaccine forecasting and supply planning",
-        "ToR, MoU, or work plans for forecasting and supply planning for vaccines exist but have certain gaps",
-        "Vaccine forecasting and supply planning prioritized in TOR, MoU, or work plans"
-
-    ]
-    plans_status = st.radio("Select work plans status:",
-                            plans_options, key="3", index=None)
-
-    st.subheader(questions[3])
-    tor_options = [
-        "The TORs does not cover any of the key FSP responsibilities",
-        "The TORs cover at least two of the outlined FSP responsibilities",
-        "The TORs cover at least four FSP responsibilities"
-    ]
-    tor_status = st.radio("Select TORs status:",
-                          tor_options, key="4", index=None)
-
-    st.subheader(questions[4])
-    strategy_options = [
-        "There is no SC strategy",
-        "There is a SC strategy, but it does not cover any of the key technical areas of FSP",
-        "The SC strategy covers the key technical areas of FSP"
-    ]
-    strategy_status = st.radio(
-        "Select SC strategy status:", strategy_options, key="5", index=None)
-
-    st.subheader(questions[5])
-    commitment_options = [
-        "No commitment from the relevant stakeholders",
-        "Limited commitment of the relevant stakeholders",
-        "Adequate commitment from relevant stakeholders"
-    ]
-    commitment_status = st.radio(
-        "Select commitment status:", commitment_options, key="6", index=None)
-
-    st.subheader(questions[6])
-    resources_options = [
-        "Resources are lacking for all FSP related tasks",
-        "Resources are limited for FSP related tasks",
-        "Adequate resources are available for all FSP related tasks"
-    ]
-    resources_status = st.radio(
-        "Select resources status:", resources_options, key="7", index=None)
-    st.subheader(questions[7])
-    section_1_comment = st.text_area("Provide comments here:", key="fsp")
-
-    # Create a data frame with the responses
-    responses = [
-        team_status, stakeholders_status,
-        plans_status, tor_status, strategy_status,
-        commitment_status, resources_status,
-        section_1_comment
-    ]
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-    questions_answers_df = pd.concat(
-        [questions_df[0:8].reset_index(drop=True), answers_df], axis=1)
-
-    scores = [
-        calculate_score(team_options,
-                        team_status),
-        calculate_score(stakeholders_options,
-                        stakeholders_status),
-        calculate_score(plans_options,
-                        plans_status),
-        calculate_score(tor_options, tor_status),
-        calculate_score(strategy_options,
-                        strategy_status),
-        calculate_score(commitment_options, commitment_status),
-        calculate_score(resources_options, resources_status)
-    ]
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_answers_df, scores_df], axis=1)
-    return combined_df
-
-
-def data_section():
-    st.subheader(questions[8])
-    disaggregated_options = [
-        "The country lacks a reliable system",
-        "The system has some gaps",
-        "The country has a reliable system"
-    ]
-    disaggregated_status = st.radio(
-        "Select disaggregated data status:", disaggregated_options, key="8", index=None)
-
-    st.subheader(questions[9])
-    access_options = ["Disaggregated data is not available",
-                      "Limited access to disaggregated data", "Seamless flow in accessing disaggregated data"]
-    access_status = st.radio(
-        "Select data access status:", access_options, key="9", index=None)
-
-    st.subheader(questions[10])
-    stock_options = ["Significant data discrepancy",
-                     "Partially accurate data", "Data matches reality/is close to accurate"]
-    stock_status = st.radio(
-        "Select stock balances status:", stock_options, key="10", index=None)
-
-    st.subheader(questions[11])
-    reporting_options = ["Poor data reporting practices",
-                         "Ad-hoc reporting and late updating", "Data is routinely and continuously updated"]
-    reporting_status = st.radio(
-        "Select reporting practices status:", reporting_options, key="11", index=None)
-
-    st.subheader(questions[12])
-    tools_options = ["Tools exist but not used", "Only one tool used",
-                     "Both forecasting and supply planning tools used"]
-    tools_status = st.radio("Select tools status:",
-                            tools_options, key="12", index=None)
-
-    st.subheader(questions[13])
-    comments = st.text_area("Provide comments here:", key="data")
-
-    responses = [
-        disaggregated_status, access_status, stock_status, reporting_status, tools_status, comments
-    ]
-
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-    questions_answers_df = pd.concat(
-        [questions_df[8:14].reset_index(drop=True), answers_df], axis=1)
-
-    scores = [
-        calculate_score(disaggregated_options,
-                        disaggregated_status),
-        calculate_score(access_options,
-                        access_status),
-        calculate_score(stock_options,
-                        stock_status),
-        calculate_score(reporting_options, reporting_status),
-        calculate_score(tools_options,
-                        tools_status)
-    ]
-
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_answers_df, scores_df], axis=1)
-
-    return combined_df
-
-
-def analysis_section():
-    st.subheader(questions[14])
-    stock_status_options = ["Stock status not assessed",
-                            "Untimely assessment of stock status", "Routinely assessed stock status"]
-    stock_status = st.radio(
-        "Select stock status assessment:", stock_status_options, key="13", index=None)
-
-    st.subheader(questions[15])
-    forecasting_method_options = [
-        "Historic procurement",
-        "Traditional demographic",
-        "Multiple methods used (including consumption-based)"
-    ]
-    forecasting_method = st.radio(
-        "Select forecasting methodology:", forecasting_method_options, key="14", index=None)
-
-    st.subheader(questions[16])
-    decentralized_data_options = ["Decentralized data not used for national forecasts",
-                                  "Partial use of decentralized data", "Data from all levels used for national forecasts"]
-    decentralized_data = st.radio(
-        "Select use of decentralized data:", decentralized_data_options, key="15", index=None)
-
-    st.subheader(questions[17])
-    triangulation_options = ["Limited data and/ or one source is used for forecasting",
-                             "Data from limited sources used for forecasting",
-                             "Quality data from all relevant and available sources is used for forecasting"
-                             ]
-    triangulation = st.radio(
-        "Select data triangulation status:", triangulation_options, key="16", index=None)
-
-    st.subheader(questions[18])
-    update_forecasts_options = ["Forecasts not calculated or updated",
-                                "Forecasts available but not updated with current data", "Accurate forecasts updated based on current data"]
-    update_forecasts = st.radio(
-        "Select update forecasts status:", update_forecasts_options, key="17", index=None)
-
-    st.subheader(questions[19])
-    determine_orders_options = [
-        "Forecasts and supply plans are not developed",
-        "Forecasts and supply plans are developed with some of the information documented (what needs to be ordered, by whom, and when the orders should be placed)",
-        "Forecasts and supply plans are developed and documented with what needs to be ordered, by whom, and by when"
-    ]
-    determine_orders = st.radio(
-        "Select determine orders status:", determine_orders_options, key="18", index=None)
-
-    st.subheader(questions[20])
-    plan_coverage_options = [
-        "The forecasts and supply plan reports cover 0-2 key components of the quantification report",
-        "The forecasts and supply plan reports cover at least 3 key components of the quantification report",
-        "The forecasts and supply plan reports cover all key components of the quantification report"
-    ]
-    plan_coverage = st.radio(
-        "Select plan coverage status:", plan_coverage_options, key="20", index=None)
-
-    st.subheader(questions[21])
-    scenario_monitoring_options = ["Scenario monitoring not conducted",
-                                   "Poorly conducted scenario monitoring", "Well-conducted scenario monitoring"]
-    scenario_monitoring = st.radio(
-        "Select scenario monitoring status:", scenario_monitoring_options, key="21", index=None)
-
-    st.subheader(questions[22])
-    expiry_estimation_options = ["Inability to estimate vaccine expiry",
-                                 "Limited ability to estimate expiry", "Ability to estimate expiry"]
-    expiry_estimation = st.radio(
-        "Select expiry estimation status:", expiry_estimation_options, key="22", index=None)
-
-    st.subheader(questions[23])
-    comments = st.text_area("Provide comments here:")
-
-    responses = [
-        stock_status, forecasting_method, decentralized_data,
-        triangulation, update_forecasts, determine_orders,
-        plan_coverage, scenario_monitoring, expiry_estimation, comments
-    ]
-
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-    questions_answers_df = pd.concat(
-        [questions_df[14:24].reset_index(drop=True), answers_df], axis=1)
-
-    scores = [
-        calculate_score(stock_status_options,
-                        stock_status),
-        calculate_score(forecasting_method_options,
-                        forecasting_method),
-        calculate_score(decentralized_data_options,
-                        decentralized_data),
-        calculate_score(triangulation_options, triangulation),
-        calculate_score(update_forecasts_options,
-                        update_forecasts),
-        calculate_score(determine_orders_options,
-                        determine_orders),
-        calculate_score(plan_coverage_options,
-                        plan_coverage),
-        calculate_score(scenario_monitoring_options, scenario_monitoring),
-        calculate_score(expiry_estimation_options,
-                        expiry_estimation)
-    ]
-
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_answers_df, scores_df], axis=1)
-
-    return combined_df
-
-
-def forecasting_supply_planning_section():
-    st.subheader(questions[24])
-    work_plans_options = ["Forecasting and supply planning activities not included",
-                          "Partially included in EPI work plans", "Adequately included in EPI work plans"]
-    work_plans_status = st.radio(
-        "Select inclusion in EPI work plans status:", work_plans_options, key="23", index=None)
-
-    st.subheader(questions[25])
-    stakeholders_options = ["Key stakeholders not included",
-                            "Limited participation by relevant stakeholders", "All relevant stakeholders included"]
-    stakeholders_status = st.radio(
-        "Select stakeholders inclusion status:", stakeholders_options, key="24", index=None)
-
-    st.subheader(questions[26])
-    meetings_options = [
-        "Supply planning meetings are not being held",
-        "Supply planning meetings are irregular/ ad-hoc and unplanned",
-        "Supply planning meetings are regularly scheduled and held, and frequent enough for decisions to be made"
-    ]
-    meetings_status = st.radio(
-        "Select supply planning meetings status:", meetings_options, key="25", index=None)
-
-    st.subheader(questions[27])
-    review_options = ["Meetings do not review past actions and recommendations",
-                      "Partial review/addressing of past actions and recommendations", "Full review and addressing of past actions and recommendations"]
-    review_status = st.radio("Select review status:",
-                             review_options, key="26", index=None)
-
-    st.subheader(questions[28])
-    flexibility_options = ["Lack of flexibility to convene ad hoc meetings",
-                           "Limited flexibility to convene ad-hoc meetings", "Flexible to convene ad-hoc meetings"]
-    flexibility_status = st.radio(
-        "Select flexibility status:", flexibility_options, key="27", index=None)
-
-    st.subheader(questions[29])
-    decisions_options = ["Decisions not made",
-                         "Decisions made in an untimely manner", "Decisions made in a timely manner"]
-    decisions_status = st.radio(
-        "Select decisions status:", decisions_options, key="28", index=None)
-
-    st.subheader(questions[30])
-    evidence_options = ["Decisions not informed by evidence",
-                        "Decisions based on limited or incomplete evidence", "Decisions based on evidence"]
-    evidence_status = st.radio(
-        "Select evidence-based decisions status:", evidence_options, key="29", index=None)
-
-    st.subheader(questions[31])
-    risks_options = ["Supply planning meetings address emergencies only",
-                     "Supply planning meetings address imminent risks", "Routine monitoring and addressing of supply risks"]
-    risks_status = st.radio(
-        "Select supply planning risks status:", risks_options, key="30", index=None)
-
-    st.subheader(questions[32])
-    comments = st.text_area("Provide comments here:",
-                            key="forecasting_supply_planning")
-
-    responses = [
-        work_plans_status, stakeholders_status, meetings_status,
-        review_status, flexibility_status, decisions_status,
-        evidence_status, risks_status, comments
-    ]
-
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-    questions_answers_df = pd.concat(
-        [questions_df[24:33].reset_index(drop=True), answers_df], axis=1)
-
-    scores = [
-        calculate_score(work_plans_options,
-                        work_plans_status),
-        calculate_score(stakeholders_options,
-                        stakeholders_status),
-        calculate_score(meetings_options,
-                        meetings_status),
-        calculate_score(review_options, review_status),
-        calculate_score(flexibility_options,
-                        flexibility_status),
-        calculate_score(decisions_options, decisions_status),
-        calculate_score(evidence_options, evidence_status),
-        calculate_score(risks_options, risks_status)
-    ]
-
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_answers_df, scores_df], axis=1)
-
-    return combined_df
-
-
-def funding_adjustments_section():
-    st.subheader(questions[33])
-    results_communication_options = ["Results not communicated to stakeholders",
-                                     "Results partially communicated to stakeholders", "Results communicated to stakeholders"]
-    results_communication_status = st.radio(
-        "Select communication of results status:", results_communication_options, index=None)
-
-    st.subheader(questions[34])
-    adjustments_communication_options = ["Adjustments not communicated to stakeholders",
-                                         "Adjustments partially communicated to stakeholders", "Adjustments communicated to stakeholders"]
-    adjustments_communication_status = st.radio(
-        "Select communication of adjustments status:", adjustments_communication_options, index=None)
-
-    st.subheader(questions[35])
-    adjustments_implementation_options = [
-        "Adjustments not implemented", "Adjustments partially implemented and/or untimely", "Adjustments implemented in a timely manner"]
-    adjustments_implementation_status = st.radio(
-        "Select adjustments implementation status:", adjustments_implementation_options, index=None)
-
-    st.subheader(questions[36])
-    total_funding_options = ["Funding not available for total commodity requirement",
-                             "Limited funding available for total commodity requirement", "Funding available for total commodity requirement"]
-    total_funding_status = st.radio(
-        "Select total funding availability status:", total_funding_options, index=None)
-
-
-    st.subheader(questions[37])
-    comments = st.text_area("Provide comments here:", key="funding_adjst")
-
-    responses = [
-        results_communication_status, adjustments_communication_status,
-        adjustments_implementation_status, total_funding_status, comments
-    ]
-
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-    questions_answers_df = pd.concat(
-        [questions_df[33:38].reset_index(drop=True), answers_df], axis=1)
-
-    scores = [
-    calculate_score(results_communication_options, results_communication_status),
-    calculate_score(adjustments_communication_options, adjustments_communication_status),
-    calculate_score(adjustments_implementation_options, adjustments_implementation_status),
-    calculate_score(total_funding_options, total_funding_status),
-    0  # <-- Add 0 to represent the comment (no score)
-]
+# Authenticate with Google Drive
 
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_answers_df, scores_df], axis=1)
-
-    return combined_df
-
-def gesi_section():
-    st.subheader(questions[38])  # Q40: Inclusion of relevant stakeholders including GESI experts
-    inclusion_options = [
-        "Relevant stakeholders, including GESI experts, not included",
-        "Limited inclusion of the relevant stakeholders, including GESI experts",
-        "All the relevant stakeholders, including GESI experts, are included and contribute meaningfully to decision-making"
-    ]
-    inclusion_status = st.radio("Select inclusion level:", inclusion_options, key="38", index=None)
-
-    st.subheader(questions[39])  # Q41: Gender-balanced, socially inclusive and diverse representation
-    balance_options = [
-        "The team does not incorporate gender balance, social inclusion, or representation of under-served groups.",
-        "The team incorporates gender balance, social inclusion, and representation of under-served groups to a limited extent.",
-        "The team effectively integrates gender balance, social inclusion, and representation of under-served groups."
-    ]
-    balance_status = st.radio("Select team composition:", balance_options, key="39", index=None)
-
-    st.subheader(questions[40])  # Q42: GESI in work plans, MoUs or TORs
-    integration_options = [
-        "GESI considerations are not included in vaccine FSP Work plans, MoUs or TORs",
-        "GESI considerations are included to a limited extent",
-        "GESI considerations are fully integrated in vaccine FSP Work plans, MoUs or TORs"
-    ]
-    integration_status = st.radio("Select GESI integration status:", integration_options, key="40", index=None)
-
-    st.subheader(questions[41])  # Q43: Disaggregated data availability
-    data_options = [
-        "The country lacks a reliable system for disaggregated data",
-        "The system captures disaggregated data, but with gaps",
-        "The country has a reliable system that consistently captures disaggregated data"
-    ]
-    data_status = st.radio("Select data disaggregation status:", data_options, key="41", index=None)
-
-    st.subheader(questions[42])  # Q44: Methodology inclusion for equity
-    methodology_options = [
-        "Forecasts do not reflect the needs of underserved or hard-to-reach populations",
-        "Forecasts partially reflect the needs of underserved populations",
-        "Forecasts adequately reflect planned efforts to reach underserved populations"
-    ]
-    methodology_status = st.radio("Select equity integration in forecasting:", methodology_options, key="42", index=None)
-
-    st.subheader(questions[43])  # Q45: Risk monitoring
-    risk_options = [
-        "Impact of risks on underserved and hard-to-reach populations is not reviewed or considered during routine supply plan monitoring",
-        "Some tracking of risks exists, but no systematic adjustments are made",
-        "Routine monitoring identifies supply risks and adjusts plans to prevent disparities"
-    ]
-    risk_status = st.radio("Select risk monitoring status:", risk_options, key="43", index=None)
-
-    st.subheader(questions[44])  # Q46: Funding for equity adjustments
-    funding_options = [
-        "Funding not available for recommended supply plan adjustments that address equity-related risks",
-        "Limited funding available for equity-related adjustments",
-        "Funding available and enables timely implementation of equity-related adjustments"
-    ]
-    funding_status = st.radio("Select equity-related funding availability:", funding_options, key="44", index=None)
-
-    st.subheader(questions[45])  # Q47: GESI Comments
-    comments = st.text_area("Provide comments on GESI:", key="45")
-
-    responses = [
-        inclusion_status, balance_status, integration_status,
-        data_status, methodology_status, risk_status, funding_status, comments
-    ]
-    questions_df_subset = questions_df[38:46].reset_index(drop=True)
-    answers_df = pd.DataFrame(responses, columns=["answer"])
-
-    scores = [
-        calculate_score(inclusion_options, inclusion_status),
-        calculate_score(balance_options, balance_status),
-        calculate_score(integration_options, integration_status),
-        calculate_score(data_options, data_status),
-        calculate_score(methodology_options, methodology_status),
-        calculate_score(risk_options, risk_status),
-        calculate_score(funding_options, funding_status),
-        0  # Score for comments
-    ]
-    scores_df = pd.DataFrame(scores, columns=["score"])
-
-    combined_df = pd.concat([questions_df_subset, answers_df, scores_df], axis=1)
-    return combined_df
 
+# Header row of each sheet, read once per process and reused by append mode
+_sheet_headers = {}
+# (country, period_of_review) -> [[first_row, last_row], ...] for each sheet
+_sheet_indexes = {}
+# One writer per sheet at a time within this process
+_sheet_locks = {}
+_sheet_locks_lock = threading.Lock()
+# Appends waiting for the sheet lock, sent together by whoever gets it next
+_pending_appends = {}
 
+WRITE_ATTEMPTS = 4
 
-countries = [
-    "Nigeria", "Democratic Republic of the Congo",
-    "Ethiopia", "Mozambique"
-]
 
+class ConcurrentWriteError(RuntimeError):
+    """The rows about to be replaced changed since they were indexed."""
 
-review_periods = [
-    "Q1 2024", "Q2 2024", "Q3 2024", "Q4 2024","Q1 2025", "Q2 2025", "Q3 2025","Q4 2025"
-]
 
-# Authenticate with Google Drive
+def sheet_lock(sheet_name):
+    with _sheet_locks_lock:
+        return _sheet_locks.setdefault(sheet_name, threading.RLock())
+
+
+class _PendingAppend:
+    def __init__(self, df):
+        self.df = df
+        self.done = threading.Event()
+        self.error = None
+
+
+def pending_appends(sheet_name=None):
+    # Queue depth: submissions waiting to be appended to the sheet(s)
+    with _sheet_locks_lock:
+        return sum(len(queue) for name, queue in _pending_appends.items() if sheet_name in (None, name))
+
+
+def _forget_sheet(sheet_name):
+    _sheet_headers.pop(sheet_name, None)
+    _sheet_indexes.pop(sheet_name, None)
+    get_sheet_cache().invalidate(sheet_name)
+    # The next write opens the sheet again by title
+    get_connection().invalidate(sheet_name)
+
+
+def _sheet_cell(value):
+    if pd.isna(value):
+        return ""
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "item"):
+        return value.item()
+    return value
 
 
-def authenticate():
-    scope = ["https://spreadsheets.google.com/feeds",
-             "https://www.googleapis.com/auth/drive"]
-    # Read Google Drive credentials from environment variable
-    creds_dict = {
-        "type": os.environ["GOOGLE_TYPE"],
-        "project_id": os.environ["GOOGLE_PROJECT_ID"],
-        "private_key_id": os.environ["GOOGLE_PRIVATE_KEY_ID"],
-        "private_key": os.environ["GOOGLE_PRIVATE_KEY"].replace('\\n', '\n'),
-        "client_email": os.environ["GOOGLE_CLIENT_EMAIL"],
-        "client_id": os.environ["GOOGLE_CLIENT_ID"],
-        "auth_uri": os.environ["GOOGLE_AUTH_URI"],
-        "token_uri": os.environ["GOOGLE_TOKEN_URI"],
-        "auth_provider_x509_cert_url": os.environ["GOOGLE_AUTH_PROVIDER_X509_CERT_URL"],
-        "client_x509_cert_url": os.environ["GOOGLE_CLIENT_X509_CERT_URL"]
-    }
-    creds = service_account.Credentials.from_service_account_info(
-        creds_dict, scopes=scope)
-    client = gspread.authorize(creds)
-    return client
-
-
-def append_to_sheet(df, sheet_name):
-    client = authenticate()
-    # Change the sheet name as needed
-    sheet = client.open(sheet_name).sheet1
-    existing_data = sheet.get_all_records()
-    existing_df = pd.DataFrame(existing_data)
-
-    # if (df["country"].isin(existing_df["country"]).all() and df["period_of_review"].isin(existing_df["period_of_review"]).all()):
-    #     st.error("This data already exists")
-    # else:
-    combined_df = pd.concat([existing_df, df], ignore_index=True)
-    set_with_dataframe(sheet, combined_df)
+def dataframe_to_rows(df, columns):
+    # Values in sheet column order, ready for a single values.append call
+    frame = df.reindex(columns=columns)
+    return [[_sheet_cell(value) for value in row] for row in frame.itertuples(index=False)]
+
+
+def submission_keys(df):
+    return list(zip(df["country"].astype(str), df["period_of_review"].astype(str)))
+
+
+def _sheet_header(sheet, sheet_name):
+    header = _sheet_headers.get(sheet_name)
+    if header is None:
+        with span("sheets.row_values", sheet=sheet_name):
+            header = sheet.row_values(1)
+        if header:
+            _sheet_headers[sheet_name] = header
+    return header
+
+
+def _cell_value(values, i):
+    # batch_get drops trailing empty rows and cells
+    return values[i][0] if i < len(values) and values[i] else ""
+
+
+def _key_columns(header):
+    from gspread.utils import rowcol_to_a1
+
+    return [rowcol_to_a1(1, header.index(column) + 1)[:-1] for column in ("country", "period_of_review")]
+
+
+def _index_rows(index, keys, first_row):
+    for offset, key in enumerate(keys):
+        row = first_row + offset
+        ranges = index.setdefault(key, [])
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+
+
+def sheet_index(sheet_name):
+    """Row ranges of every (country, period_of_review) block in the sheet.
+
+    Built from the two key columns in one request the first time it is needed,
+    then kept up to date by ``append_to_sheet``.
+    """
+    index = _sheet_indexes.get(sheet_name)
+    if index is None:
+        sheet = get_connection().worksheet(sheet_name)
+        header = _sheet_header(sheet, sheet_name)
+        index = {}
+        if header and "country" in header and "period_of_review" in header:
+            country_col, period_col = _key_columns(header)
+            with span("sheets.batch_get", sheet=sheet_name):
+                country_values, period_values = sheet.batch_get(
+                    [f"{country_col}2:{country_col}", f"{period_col}2:{period_col}"])
+            n_rows = max(len(country_values), len(period_values))
+            _index_rows(index, [(_cell_value(country_values, i), _cell_value(period_values, i))
+                                for i in range(n_rows)], first_row=2)
+        _sheet_indexes[sheet_name] = index
+    return index
+
+
+def submission_exists(sheet_name, country, period_of_review):
+    return (str(country), str(period_of_review)) in sheet_index(sheet_name)
+
+
+def _check_ranges(sheet, sheet_name, header, ranges, keys):
+    # Optimistic check: the rows about to be overwritten or deleted still hold
+    # these submissions, i.e. nobody inserted or removed rows above them since
+    # the index was built
+    columns = _key_columns(header)
+    with span("sheets.batch_get", sheet=sheet_name, ranges=len(ranges)):
+        values = sheet.batch_get([f"{column}{first}:{column}{last}" for first, last in ranges for column in columns])
+    for (first, last), countries, periods in zip(ranges, values[0::2], values[1::2]):
+        found = {(_cell_value(countries, i), _cell_value(periods, i)) for i in range(last - first + 1)}
+        if not found <= keys:
+            raise ConcurrentWriteError(f"Rows {first}-{last} of '{sheet_name}' changed since they were indexed")
+
+
+def _replace_rows(sheet, sheet_name, header, df):
+    from gspread.utils import rowcol_to_a1
+
+    index = sheet_index(sheet_name)
+    keys = set(submission_keys(df))
+    ranges = [r for key in keys for r in index.get(key, [])]
+    rows = dataframe_to_rows(df, header)
+    if ranges:
+        _check_ranges(sheet, sheet_name, header, ranges, keys)
+    if len(ranges) == 1 and ranges[0][1] - ranges[0][0] + 1 == len(rows):
+        # Same block size: overwrite the existing rows in place
+        first, last = ranges[0]
+        with span("sheets.update", sheet=sheet_name, rows=len(rows)):
+            sheet.update(range_name=f"A{first}:{rowcol_to_a1(last, len(header))}",
+                         values=rows, value_input_option="USER_ENTERED")
+        get_sheet_cache().invalidate(sheet_name)
+        return
+    if ranges:
+        # Block size changed or old duplicates exist: drop them (bottom-up) in one request
+        with span("sheets.delete_rows", sheet=sheet_name, blocks=len(ranges)):
+            sheet.spreadsheet.batch_update({"requests": [
+                {"deleteDimension": {"range": {"sheetId": sheet.id, "dimension": "ROWS",
+                                               "startIndex": first - 1, "endIndex": last}}}
+                for first, last in sorted(ranges, reverse=True)
+            ]})
+        _sheet_indexes.pop(sheet_name, None)
+        get_sheet_cache().invalidate(sheet_name)
+    _append_rows(sheet, sheet_name, header, df, rows)
+
+
+def _append_rows(sheet, sheet_name, header, df, rows):
+    from gspread.utils import a1_range_to_grid_range
+
+    with span("sheets.append_rows", sheet=sheet_name, rows=len(rows)):
+        response = sheet.append_rows(rows, value_input_option="USER_ENTERED",
+                                     insert_data_option="INSERT_ROWS", table_range="A1")
+    get_sheet_cache().expire(sheet_name)
+    index = _sheet_indexes.get(sheet_name)
+    if index is not None:
+        updated_range = response["updates"]["updatedRange"].split("!")[-1]
+        first_row = a1_range_to_grid_range(updated_range)["startRowIndex"] + 1
+        _index_rows(index, submission_keys(df), first_row + len(rows) - len(df))
+
+
+def append_to_sheet(df, sheet_name, mode="append"):
+    """Write ``df`` to the first worksheet of ``sheet_name``.
+
+    ``mode="append"`` (default) sends only the new rows in one batched request.
+    ``mode="upsert"`` replaces the rows of the same (country, period_of_review)
+    in place, falling back to an append when there are none.
+    ``mode="rewrite"`` reads the whole sheet, concatenates and writes it back.
+    Columns missing from the header are added to its right.
+
+    Writes to a sheet are serialized within the process; appends that arrive
+    while another write is in flight are coalesced into one request. Upserts
+    and rewrites first check that the rows they replace are unchanged; if
+    another process changed them, the cached header and index are dropped and
+    the write is retried (``ConcurrentWriteError`` after ``WRITE_ATTEMPTS``).
+    The same happens when the sheet was renamed or recreated (HTTP 404).
+    """
+    if mode not in ("append", "upsert", "rewrite"):
+        raise ValueError(f"Unknown write mode: {mode}")
+    if mode != "append":
+        with sheet_lock(sheet_name):
+            return _write_with_retries(sheet_name, df, mode)
+
+    # Appends from concurrent sessions queue up while a write is in flight
+    # and the next lock holder sends all of them in one values.append
+    pending = _PendingAppend(df)
+    with _sheet_locks_lock:
+        _pending_appends.setdefault(sheet_name, []).append(pending)
+    with sheet_lock(sheet_name):
+        if not pending.done.is_set():
+            with _sheet_locks_lock:
+                batch = _pending_appends.pop(sheet_name, [])
+            try:
+                _write_with_retries(sheet_name, pd.concat([item.df for item in batch], ignore_index=True), "append")
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            for item in batch:
+                item.done.set()
+    if pending.error is not None:
+        raise pending.error
+
+
+def _write_with_retries(sheet_name, df, mode):
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            return _write_sheet(get_connection().worksheet(sheet_name), sheet_name, df, mode)
+        except Exception as e:
+            if not (isinstance(e, ConcurrentWriteError) or is_not_found(e)):
+                raise
+            print(e)
+            _forget_sheet(sheet_name)
+            if attempt == WRITE_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, 0.5 * attempt))
+
+
+def _write_sheet(sheet, sheet_name, df, mode):
+    # The gspread helpers are imported on the first write, so that importing
+    # this module (and rendering the form) does not load the Sheets client
+    from gspread.utils import rowcol_to_a1
+    from gspread_dataframe import set_with_dataframe
+
+    if mode == "rewrite":
+        with span("sheets.get_all_records", sheet=sheet_name):
+            existing_data = sheet.get_all_records()
+        existing_df = pd.DataFrame(existing_data)
+        combined_df = pd.concat([existing_df, df], ignore_index=True)
+        # Rows appended by another process since the read would be overwritten
+        with span("sheets.col_values", sheet=sheet_name):
+            current_rows = len(sheet.col_values(1))
+        if max(current_rows, 1) != len(existing_data) + 1:
+            raise ConcurrentWriteError(f"'{sheet_name}' grew from {len(existing_data)} to {current_rows - 1} rows")
+        with span("sheets.set_with_dataframe", sheet=sheet_name, rows=len(combined_df)):
+            set_with_dataframe(sheet, combined_df)
+        _sheet_headers[sheet_name] = list(combined_df.columns)
+        _sheet_indexes.pop(sheet_name, None)
+        get_sheet_cache().invalidate(sheet_name)
+        return
+
+    header = _sheet_header(sheet, sheet_name)
+    rows = []
+    if not header:
+        header = list(df.columns)
+        rows.append(header)
+    missing = [column for column in df.columns if column not in header]
+    if missing and not rows:
+        # Another process may have added them already; check the live header first
+        _sheet_headers.pop(sheet_name, None)
+        header = _sheet_header(sheet, sheet_name)
+        missing = [column for column in df.columns if column not in header]
+    if missing and not rows:
+        # New columns are added at the right of the header; existing rows are left blank there
+        if len(header) + len(missing) > sheet.col_count:
+            sheet.add_cols(len(header) + len(missing) - sheet.col_count)
+        sheet.update(range_name=f"{rowcol_to_a1(1, len(header) + 1)}:{rowcol_to_a1(1, len(header) + len(missing))}",
+                     values=[missing])
+        header = header + missing
+
+    if mode == "upsert" and not rows:
+        _replace_rows(sheet, sheet_name, header, df)
+    else:
+        rows.extend(dataframe_to_rows(df, header))
+        _append_rows(sheet, sheet_name, header, df, rows)
+    _sheet_headers[sheet_name] = header
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+DRAFT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+
+class DraftStore:
+    """Autosaved answers of assessments that have not been submitted yet.
+
+    Every widget change is written as one (draft_id, key, value) row, so a
+    save costs a single small upsert no matter how far the form is filled.
+    ``load`` returns the latest value of every key of a draft.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS draft_answers ("
+                "draft_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (draft_id, key)) WITHOUT ROWID")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def save(self, draft_id, key, value):
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO draft_answers VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(draft_id, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (draft_id, key, json.dumps(value), time.time()))
+
+    def save_many(self, draft_id, values):
+        with closing(self.connect()) as connection, connection:
+            now = time.time()
+            connection.executemany(
+                "INSERT INTO draft_answers VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(draft_id, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(draft_id, key, json.dumps(value), now) for key, value in values.items()])
+
+    def load(self, draft_id):
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT key, value FROM draft_answers WHERE draft_id = ?", (draft_id,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def discard(self, draft_id):
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM draft_answers WHERE draft_id = ?", (draft_id,))
+
+    def prune(self, max_age=DRAFT_MAX_AGE_SECONDS):
+        # Drop drafts nobody has touched for a while
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                "DELETE FROM draft_answers WHERE draft_id IN "
+                "(SELECT draft_id FROM draft_answers GROUP BY draft_id HAVING MAX(updated_at) < ?)",
+                (time.time() - max_age,))
+
+
+_drafts = None
+_drafts_lock = threading.Lock()
+
+
+def get_draft_store():
+    global _drafts
+    with _drafts_lock:
+        if _drafts is None:
+            _drafts = DraftStore(os.environ.get("ICSPS_DRAFTS_PATH", "data/drafts.sqlite3"))
+            _drafts.prune()
+        return _drafts
@@ -0,0 +1,143 @@
+"""Columnar snapshot of the assessment data for Power BI and analysts.
+
+Writes typed Parquet files under the output directory:
+
+- ``questions.parquet`` / ``options.parquet``: dimension tables of the instrument
+- ``instrument_map.parquet``: (question_id, option_code) of every earlier
+  instrument version mapped to the current ids
+- ``submissions/country=../period_of_review=../``: one row per submission
+- ``responses/country=../period_of_review=../``: one row per answered question,
+  with small integer question ids and option codes
+- ``comments/country=../period_of_review=../``: free-text comment boxes
+
+Runs are incremental: a (country, period_of_review) partition is only
+(re)written when its set of submissions changed since the last export.
+
+    python export.py --out exports
+"""
+import argparse
+import json
+import os
+import shutil
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from question_bank import QUESTION_BANK, Question
+from schema import split_submissions, version_map
+from storage import get_storage
+
+
+STATE_FILE = "_export_state.json"
+DICTIONARY_COLUMNS = ["country", "period_of_review", "section", "maturity_level", "instrument_version",
+                      "from_version"]
+
+
+def question_dimension(bank=QUESTION_BANK):
+    return pd.DataFrame({
+        "question_id": np.array([row.id for row in bank.rows], dtype=np.int16),
+        "position": np.arange(len(bank.rows), dtype=np.int16),
+        "key": [row.key for row in bank.rows],
+        "section": pd.Categorical([row.section for row in bank.rows]),
+        "text": [row.text for row in bank.rows],
+        "is_comment": [not isinstance(row, Question) for row in bank.rows],
+        "weight": np.array([getattr(row, "weight", 0) for row in bank.rows], dtype=np.float32),
+    })
+
+
+def option_dimension(bank=QUESTION_BANK):
+    records = [(row.id, option_id, option, index + 1)
+               for row in bank.questions
+               for index, (option_id, option) in enumerate(zip(row.option_ids, row.options))]
+    df = pd.DataFrame(records, columns=["question_id", "option_code", "text", "points"])
+    return df.astype({"question_id": np.int16, "option_code": np.int8, "points": np.int8})
+
+
+def normalize(df, bank=QUESTION_BANK):
+    """Split flat rows into submissions, responses and comments frames.
+
+    Same split as the storage backends, plus the partition columns on every
+    table and the total score on submissions.
+    """
+    submissions, responses, comments, _ = split_submissions(df, bank, strict=False)
+    submissions["date_of_assessment"] = pd.to_datetime(submissions["date_of_assessment"], errors="coerce")
+    totals = responses.groupby("submission_id")["score"].sum()
+    submissions["total_score"] = submissions["submission_id"].map(totals).astype(np.float32)
+    keys = submissions.set_index("submission_id")[["country", "period_of_review"]]
+    return submissions, responses.join(keys, on="submission_id"), comments.join(keys, on="submission_id")
+
+
+def _arrow_table(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for column in DICTIONARY_COLUMNS:
+        if column in table.column_names:
+            index = table.column_names.index(column)
+            table = table.set_column(index, column, table.column(column).dictionary_encode())
+    return table
+
+
+def _partition_dir(root, table_name, country, period_of_review):
+    return os.path.join(root, table_name, f"country={quote(str(country), safe='')}",
+                        f"period_of_review={quote(str(period_of_review), safe='')}")
+
+
+def _write_partition(root, table_name, country, period_of_review, df):
+    directory = _partition_dir(root, table_name, country, period_of_review)
+    shutil.rmtree(directory, ignore_errors=True)
+    if df.empty:
+        return
+    os.makedirs(directory)
+    # Partition columns live in the directory names only
+    pq.write_table(_arrow_table(df.drop(columns=["country", "period_of_review"])),
+                   os.path.join(directory, "part-0.parquet"), compression="zstd")
+
+
+def export_snapshot(df, out_dir, full=False):
+    """Write the snapshot; returns the number of partitions (re)written."""
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = {}
+    if not full and os.path.exists(state_path):
+        # Ids are stable across instrument versions, so partitions stay valid after an upgrade
+        with open(state_path) as f:
+            state = json.load(f)["partitions"]
+
+    pq.write_table(_arrow_table(question_dimension()), os.path.join(out_dir, "questions.parquet"))
+    pq.write_table(_arrow_table(option_dimension()), os.path.join(out_dir, "options.parquet"))
+    pq.write_table(_arrow_table(version_map()), os.path.join(out_dir, "instrument_map.parquet"))
+    if df.empty:
+        return 0
+
+    submissions, responses, comments = normalize(df)
+    written = 0
+    for (country, period_of_review), partition in submissions.groupby(["country", "period_of_review"]):
+        partition_key = f"{country}|{period_of_review}"
+        ids = sorted(int(i) for i in partition["submission_id"])
+        if state.get(partition_key) == ids:
+            continue
+        selected = set(ids)
+        for table_name, frame in (("submissions", submissions), ("responses", responses), ("comments", comments)):
+            _write_partition(out_dir, table_name, country, period_of_review,
+                             frame[frame["submission_id"].isin(selected)])
+        state[partition_key] = ids
+        written += 1
+
+    with open(state_path, "w") as f:
+        json.dump({"instrument_version": QUESTION_BANK.version, "partitions": state}, f, indent=1)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export assessments to partitioned Parquet.")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--full", action="store_true", help="Rewrite every partition")
+    args = parser.parse_args(argv)
+    written = export_snapshot(get_storage().read(), args.out, full=args.full)
+    print(f"Wrote {written} partition(s) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Headless grading of answer sets, for partners grading in bulk from their own systems.
+
+    python grade.py answers.csv > graded.csv
+    python grade.py answers.jsonl --workers 4 --out graded.jsonl
+    python grade.py --serve --port 8502
+
+Input rows use the bulk import template columns: one column per question
+key holding the option text or its number (1, 2 or 3). Other columns (ids,
+country, ...) are passed through; comment boxes are dropped. CSV or JSON
+Lines (one object per line) go in, the same format comes out with the total
+score, maturity level and per-section score, percentage and level added.
+Rows with answers that are not options of their question get an ``error``
+and no scores.
+
+Input is read and graded ``--chunk-rows`` rows at a time, so memory stays
+flat whatever its size; with ``--workers`` chunks are graded in parallel
+processes that all use the scoring tables compiled here. ``--serve`` runs
+the same over HTTP: POST the file to ``/grade`` with ``Content-Type:
+text/csv`` or ``application/x-ndjson`` and the graded rows stream back.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+
+import numpy as np
+
+import scoring
+from question_bank import encode_cells
+
+
+FORMATS = ("csv", "jsonl")
+CHUNK_ROWS = 1000
+
+
+def _use_engine(engine):
+    # Pool initializer: workers grade with the parent's compiled tables
+    scoring._engine = engine
+
+
+def read_rows(lines, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError(f"Line {number} is not a JSON object")
+            yield row
+
+
+def grade_rows(rows):
+    """Graded copies of a list of answer rows."""
+    engine = scoring.get_scoring_engine()
+    bank = engine.bank
+    codes = np.empty((len(rows), len(bank.questions)), dtype=np.int8)
+    for question in bank.questions:
+        codes[:, question.position] = encode_cells(question, [row.get(question.key) for row in rows])
+    invalid = codes == -2
+    codes[invalid] = -1
+    graded = engine.grade(codes).to_dict("records")
+
+    row_keys = {row.key for row in bank.rows}
+    results = []
+    for i, row in enumerate(rows):
+        result = {key: value for key, value in row.items() if key not in row_keys}
+        if invalid[i].any():
+            keys = [bank.questions[position].key for position in np.flatnonzero(invalid[i])]
+            result["error"] = f"Not an option of the question: {', '.join(keys)}"
+        else:
+            result["error"] = ""
+            result.update((key, value.item() if hasattr(value, "item") else value)
+                          for key, value in graded[i].items())
+        results.append(result)
+    return results
+
+
+def grade_columns():
+    engine = scoring.get_scoring_engine()
+    return list(engine.grade(np.full(len(engine.bank.questions), -1)).columns)
+
+
+def graded_chunks(rows, chunk_rows=CHUNK_ROWS, pool=None, workers=1):
+    """Grade ``rows`` chunk by chunk, in input order.
+
+    With a process ``pool`` at most two chunks per worker are in flight, so
+    the input is never read ahead further than that.
+    """
+    rows = iter(rows)
+    chunks = iter(lambda: list(islice(rows, chunk_rows)), [])
+    if pool is None:
+        for chunk in chunks:
+            yield grade_rows(chunk)
+        return
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(grade_rows, chunk))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def grade_output(lines, fmt, chunk_rows=CHUNK_ROWS, pool=None, workers=1):
+    """Graded rows of ``lines`` as text, one chunk at a time."""
+    fieldnames = None
+    for results in graded_chunks(read_rows(lines, fmt), chunk_rows, pool, workers):
+        out = io.StringIO()
+        if fmt == "jsonl":
+            for result in results:
+                out.write(json.dumps(result, default=str) + "\n")
+        else:
+            header = fieldnames is None
+            if header:
+                columns = grade_columns()
+                fieldnames = [key for key in results[0] if key not in columns] + columns
+            writer = csv.DictWriter(out, fieldnames, extrasaction="ignore", lineterminator="\n")
+            if header:
+                writer.writeheader()
+            writer.writerows(results)
+        yield out.getvalue()
+
+
+def error_record(fmt, message, fieldnames=None):
+    # Last row of a response that stopped early, in the format of the rows before it
+    if fmt == "jsonl":
+        return json.dumps({"error": message}) + "\n"
+    out = io.StringIO()
+    csv.DictWriter(out, fieldnames or ["error"], extrasaction="ignore", lineterminator="\n").writerow({"error": message})
+    return out.getvalue()
+
+
+def _pool(workers):
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, initializer=_use_engine, initargs=(scoring.get_scoring_engine(),))
+
+
+def _body_lines(rfile, length):
+    remaining = length
+    while remaining > 0:
+        line = rfile.readline(remaining)
+        if not line:
+            break
+        remaining -= len(line)
+        yield line.decode("utf-8")
+
+
+class _GradeHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.split("?")[0] != "/grade":
+            self.send_error(404)
+            return
+        fmt = "csv" if "csv" in self.headers.get("Content-Type", "") else "jsonl"
+        output = grade_output(_body_lines(self.rfile, int(self.headers.get("Content-Length", 0))), fmt,
+                              pool=self.server.pool, workers=self.server.workers)
+        try:
+            first = next(output, "")
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        # No Content-Length: the graded rows are streamed and the connection closed
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv" if fmt == "csv" else "application/x-ndjson")
+        self.end_headers()
+        self.wfile.write(first.encode())
+        try:
+            for text in output:
+                self.wfile.write(text.encode())
+        except (BrokenPipeError, ConnectionResetError):
+            self.log_error("Client went away before grading finished")
+        except Exception as e:
+            # The 200 is already sent: end the stream with an error row instead
+            self.log_error("Grading stopped: %r", e)
+            fieldnames = next(csv.reader([first.partition("\n")[0]]), None) if fmt == "csv" else None
+            self.wfile.write(error_record(fmt, f"Grading stopped: {e}", fieldnames).encode())
+
+    def log_request(self, *args):
+        # Errors are still logged to stderr through log_error
+        pass
+
+
+def serve(port, workers=1):
+    server = ThreadingHTTPServer(("", port), _GradeHandler)
+    server.pool, server.workers = _pool(workers), workers
+    print(f"Grading on http://localhost:{port}/grade")
+    try:
+        server.serve_forever()
+    finally:
+        if server.pool is not None:
+            server.pool.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade answer sets (CSV or JSON Lines) with the scoring methodology.")
+    parser.add_argument("input", nargs="?", default="-", help="Input file, - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Input and output format (default: from the file name)")
+    parser.add_argument("--out", default="-", help="Output file, - for stdout")
+    parser.add_argument("--workers", type=int, default=1, help="Processes grading in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows graded at a time")
+    parser.add_argument("--serve", action="store_true", help="Serve POST /grade over HTTP instead")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ICSPS_GRADE_PORT", "8502")))
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port, args.workers)
+        return
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    target = sys.stdout if args.out == "-" else open(args.out, "w", newline="", encoding="utf-8")
+    pool = _pool(args.workers)
+    try:
+        for text in grade_output(source, fmt, args.chunk_rows, pool, args.workers):
+            target.write(text)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        for f in (source, target):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+
+
+if __name__ == "__main__":
+    main()
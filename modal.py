@@ -1,11 +1,19 @@
 import streamlit as st
 from streamlit_modal import Modal
-modal = Modal(key="Demo Key", title="Validation", max_width=500, padding=10)
 
-open_modal = st.button(label='button', key="btkfjsdfh")
-if open_modal:
-    with modal.container():
+replace_modal = Modal(key="replace_submission", title="Validation", max_width=500, padding=10)
+
+
+def confirm_replace(country_name, period_of_review):
+    # True/False once the user has answered, None while the prompt is waiting
+    with replace_modal.container():
         st.write(
-            "Data for country x for review period x already exists! Would you like to replace it with this data?")
-        st.button(label="Yes", key="resubmit", type="primary")
-        st.button(label="No", key="dont_submit", type="primary")
+            f"Data for {country_name} for review period {period_of_review} already exists! Would you like to replace it with this data?")
+        col1, col2 = st.columns(2)
+        replace = col1.button(label="Yes", key="resubmit", type="primary")
+        keep = col2.button(label="No", key="dont_submit", type="primary")
+    if replace:
+        return True
+    if keep:
+        return False
+    return None
@@ -0,0 +1,255 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+INSTRUMENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instrument.json")
+# Earlier instrument versions, one <version>.json each, kept to read rows stamped with them
+INSTRUMENT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instruments")
+# Rows stored before submissions were stamped with an instrument version
+LEGACY_INSTRUMENT_VERSION = "2025.1"
+
+
+class InstrumentError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Question:
+    # Stable id of the question across instrument versions (stored as question_id)
+    id: int
+    key: str
+    text: str
+    prompt: str
+    options: tuple
+    weight: float
+    section: str
+    # Index of the question in QuestionBank.questions / response vectors
+    position: int
+    # option text -> option index, so answers are never looked up by list scan
+    codes: dict = field(compare=False, repr=False)
+    # Stable id of each option (stored as option_code), in option order
+    option_ids: tuple = ()
+
+    @property
+    def option_indices(self):
+        return range(len(self.options))
+
+
+@dataclass(frozen=True)
+class Comment:
+    id: int
+    key: str
+    text: str
+    prompt: str
+    section: str
+
+
+@dataclass(frozen=True)
+class Section:
+    id: str
+    title: str
+    questions: tuple
+    comment: Comment
+
+
+@dataclass(frozen=True)
+class QuestionBank:
+    """The assessment instrument, validated and flattened once at import.
+
+    ``rows`` holds the questions and comment boxes in the order they are
+    stored (one row each per submission); ``questions`` only the scored ones.
+    A response is an integer vector with one option index per question (-1
+    when unanswered), which ``score_codes`` turns into weighted scores.
+
+    Stored data refers to rows and options by their stable ``id`` and
+    ``option_ids`` instead of their text; ``migrations`` maps the ids of
+    earlier versions to this one.
+    """
+
+    version: str
+    sections: tuple
+    rows: tuple
+    questions: tuple
+    weights: np.ndarray = field(compare=False, repr=False)
+    # row id -> Question or Comment
+    by_id: dict = field(compare=False, repr=False, default_factory=dict)
+    # old version -> {"questions": {old id: new id}, "options": {(old id, old option id): new option id}}
+    migrations: dict = field(compare=False, repr=False, default_factory=dict)
+
+    @property
+    def row_texts(self):
+        return tuple(row.text for row in self.rows)
+
+
+def _require(condition, message):
+    if not condition:
+        raise InstrumentError(message)
+
+
+def _row_id(spec, ids):
+    row_id = spec.get("id")
+    _require(isinstance(row_id, int) and 0 <= row_id < 32767 and row_id not in ids,
+             f"Missing or duplicate id on '{spec.get('key')}'")
+    ids.add(row_id)
+    return row_id
+
+
+def _compile_migration(version, spec, by_id):
+    # Ids not listed keep their value; null retires a question
+    questions = {int(old): new for old, new in spec.get("questions", {}).items()}
+    options = {(int(old), int(old_option)): new_option
+               for old, mapping in spec.get("options", {}).items()
+               for old_option, new_option in mapping.items()}
+    for old, new in questions.items():
+        _require(new is None or new in by_id, f"Migration from {version} maps question {old} to unknown id {new}")
+    for (old, old_option), new_option in options.items():
+        row = by_id.get(questions.get(old, old))
+        _require(isinstance(row, Question) and new_option in row.option_ids,
+                 f"Migration from {version} maps option {old}:{old_option} to unknown option {new_option}")
+    return {"questions": questions, "options": options}
+
+
+def compile_question_bank(spec):
+    _require(isinstance(spec.get("version"), str) and spec["version"], "Instrument needs a version")
+    _require(spec.get("sections"), "Instrument has no sections")
+
+    keys = set()
+    ids = set()
+    section_ids = set()
+    position = 0
+    sections = []
+    for section_spec in spec["sections"]:
+        section_id, title = section_spec.get("id"), section_spec.get("title")
+        _require(section_id and title, f"Section needs an id and a title: {section_spec}")
+        _require(section_id not in section_ids, f"Duplicate section id '{section_id}'")
+        section_ids.add(section_id)
+
+        questions = []
+        for question_spec in section_spec.get("questions", []):
+            key = question_spec.get("key")
+            _require(key and key not in keys, f"Missing or duplicate question key '{key}' in '{section_id}'")
+            keys.add(key)
+            row_id = _row_id(question_spec, ids)
+            options = tuple(question_spec.get("options", []))
+            _require(len(options) >= 2, f"Question '{key}' needs at least two options")
+            _require(len(set(options)) == len(options), f"Question '{key}' has duplicate options")
+            option_ids = tuple(question_spec.get("option_ids", range(len(options))))
+            _require(len(option_ids) == len(options) and len(set(option_ids)) == len(option_ids)
+                     and all(isinstance(i, int) and 0 <= i < 127 for i in option_ids),
+                     f"Question '{key}' needs one distinct small integer option id per option")
+            weight = question_spec.get("weight", 1)
+            _require(isinstance(weight, (int, float)) and weight >= 0,
+                     f"Question '{key}' has an invalid weight: {weight}")
+            questions.append(Question(id=row_id, key=key, text=question_spec["text"], prompt=question_spec["prompt"],
+                                      options=options, weight=weight, section=title, position=position,
+                                      codes={option: i for i, option in enumerate(options)},
+                                      option_ids=option_ids))
+            position += 1
+        _require(questions, f"Section '{section_id}' has no questions")
+
+        comment_spec = section_spec.get("comment")
+        _require(comment_spec, f"Section '{section_id}' has no comment box")
+        _require(comment_spec["key"] not in keys, f"Duplicate key '{comment_spec['key']}'")
+        keys.add(comment_spec["key"])
+        comment = Comment(id=_row_id(comment_spec, ids), key=comment_spec["key"], text=comment_spec["text"],
+                          prompt=comment_spec["prompt"], section=title)
+        sections.append(Section(id=section_id, title=title, questions=tuple(questions), comment=comment))
+
+    rows = tuple(row for section in sections for row in (*section.questions, section.comment))
+    scored = tuple(row for row in rows if isinstance(row, Question))
+    by_id = {row.id: row for row in rows}
+    return QuestionBank(
+        version=spec["version"],
+        sections=tuple(sections),
+        rows=rows,
+        questions=scored,
+        weights=np.array([q.weight for q in scored], dtype=float),
+        by_id=by_id,
+        migrations={version: _compile_migration(version, migration, by_id)
+                    for version, migration in spec.get("migrations", {}).items()},
+    )
+
+
+def score_codes(codes, weights):
+    """Weighted score per question for one or many response vectors.
+
+    ``codes`` holds option indices (-1 = unanswered) with questions along the
+    last axis; option ``i`` is worth ``i + 1`` points times the weight.
+    """
+    codes = np.asarray(codes)
+    return weights * np.where(codes >= 0, codes + 1, 0)
+
+
+def _option_number(text):
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def encode_cells(question, values):
+    """Option indices for one question column; -2 marks an invalid answer.
+
+    Cells may hold the option text or its 1-based number; blanks are unanswered.
+    """
+    codes = np.full(len(values), -1, dtype=np.int8)
+    for i, value in enumerate(values):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            continue
+        text = str(value).strip()
+        if not text:
+            continue
+        number = _option_number(text)
+        if text in question.codes:
+            codes[i] = question.codes[text]
+        elif number is not None and 1 <= number <= len(question.options):
+            codes[i] = number - 1
+        else:
+            codes[i] = -2
+    return codes
+
+
+def load_question_bank(path=INSTRUMENT_PATH):
+    with open(path, encoding="utf-8") as f:
+        return compile_question_bank(json.load(f))
+
+
+QUESTION_BANK = load_question_bank()
+
+_archived_banks = {}
+
+
+def question_bank_for_version(version, bank=None):
+    """The instrument a row stamped with ``version`` was recorded with."""
+    bank = bank or QUESTION_BANK
+    if version == bank.version:
+        return bank
+    if version not in _archived_banks:
+        path = os.path.join(INSTRUMENT_ARCHIVE_DIR, f"{version}.json")
+        if not os.path.exists(path):
+            raise InstrumentError(f"Unknown instrument version '{version}' (no {path})")
+        _archived_banks[version] = load_question_bank(path)
+    return _archived_banks[version]
+
+
+def migrate_ids(bank, version, question_ids, option_ids):
+    """Map (question id, option id) arrays of ``version`` to ``bank``'s ids.
+
+    Retired questions get -1; option ids of -1 (unanswered) stay -1.
+    """
+    question_ids = np.array(question_ids, dtype=int)
+    option_ids = np.array(option_ids, dtype=int)
+    if version == bank.version:
+        return question_ids, option_ids
+    migration = bank.migrations.get(version, {"questions": {}, "options": {}})
+    questions, options = migration["questions"], migration["options"]
+    new_questions = np.array([questions.get(i, i if i in bank.by_id else None) for i in question_ids], dtype=object)
+    new_options = np.array([options.get((q, o), o) if o >= 0 else -1 for q, o in zip(question_ids, option_ids)],
+                           dtype=int)
+    retired = np.array([q is None for q in new_questions], dtype=bool)
+    new_questions[retired] = -1
+    return new_questions.astype(int), new_options
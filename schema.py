@@ -0,0 +1,178 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from question_bank import (
+    LEGACY_INSTRUMENT_VERSION, QUESTION_BANK, Question, migrate_ids, question_bank_for_version,
+)
+
+
+# Column order of the flat assessment table (same as the Google Sheet header)
+ASSESSMENT_COLUMNS = [
+    "questions", "answer", "score",
+    "country", "assessors_name", "assessors_affiliation",
+    "period_of_review", "date_of_assessment", "section",
+    "maturity_level", "participants", "instrument_version"
+]
+
+SUBMISSION_COLUMNS = [
+    "submission_id", "country", "assessors_name", "assessors_affiliation",
+    "period_of_review", "date_of_assessment", "maturity_level", "participants", "instrument_version"
+]
+RESPONSE_COLUMNS = ["submission_id", "question_id", "option_code", "score"]
+COMMENT_COLUMNS = ["submission_id", "question_id", "text"]
+VERSION_MAP_COLUMNS = ["from_version", "from_question_id", "from_option_code", "question_id", "option_code"]
+
+
+def submission_ids(df):
+    # Stable positive 63-bit id from the natural key of a submission
+    keys = (df["country"].astype(str) + "|" + df["period_of_review"].astype(str)
+            + "|" + df["date_of_assessment"].astype(str))
+    return keys.map(lambda key: int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") >> 1)
+
+
+def instrument_versions(df):
+    # Version each row was recorded with; unstamped rows predate version stamping
+    if "instrument_version" not in df:
+        return pd.Series(LEGACY_INSTRUMENT_VERSION, index=df.index)
+    versions = df["instrument_version"].astype(object).where(df["instrument_version"].notna(), "")
+    versions = versions.astype(str)
+    return versions.where(versions != "", LEGACY_INSTRUMENT_VERSION)
+
+
+def _encode_rows(df, bank, source):
+    # Question and option ids of rows recorded with instrument ``source``,
+    # translated to ``bank``'s ids. Unknown texts get question id -1 and
+    # answers that are not options of their question option code -2.
+    question_ids = {row.text: row.id for row in source.rows}
+    old_ids = df["questions"].map(question_ids).fillna(-1).to_numpy(dtype=int)
+    answers = df["answer"].astype(object).where(df["answer"].notna(), None)
+    old_options = np.array([
+        (row.option_ids[row.codes[answer]] if answer in row.codes else -2 if answer else -1)
+        if isinstance(row, Question) else -1
+        for row, answer in zip((source.by_id.get(i) for i in old_ids), answers)], dtype=int)
+    new_ids, new_options = migrate_ids(bank, source.version, old_ids, np.where(old_options == -2, -1, old_options))
+    new_ids[old_ids == -1] = -1
+    return new_ids, np.where(old_options == -2, -2, new_options)
+
+
+def encode_rows(df, bank=QUESTION_BANK):
+    """Question ids and option codes of flat rows in ``bank``'s ids, each row
+    read with the instrument version it was recorded with."""
+    versions = instrument_versions(df)
+    question_ids = np.full(len(df), -1)
+    option_codes = np.full(len(df), -1)
+    for version in versions.unique():
+        rows = (versions == version).to_numpy()
+        question_ids[rows], option_codes[rows] = _encode_rows(df[rows], bank, question_bank_for_version(version, bank))
+    return question_ids, option_codes
+
+
+def split_submissions(df, bank=QUESTION_BANK, strict=True):
+    """Split flat rows into (submissions, responses, comments, skipped).
+
+    ``submissions`` has one row per submission keyed by ``submission_id``,
+    ``responses`` one (submission_id, question_id, option_code, score) row per
+    question and ``comments`` the non-empty comment boxes. ``question_id`` and
+    ``option_code`` are the stable ids of ``bank`` (-1 = unanswered); rows
+    recorded with an earlier ``instrument_version`` are read with that
+    version's texts and translated through its migration. With ``strict``
+    unknown questions or answers raise ValueError; otherwise the rows are
+    dropped or treated as unanswered, and ``skipped`` counts the dropped rows.
+    """
+    df = df.reset_index(drop=True)
+    df["submission_id"] = submission_ids(df)
+    df["instrument_version"] = instrument_versions(df)
+    df["question_id"], df["option_code"] = encode_rows(df, bank)
+    unknown = df["question_id"] == -1
+    if unknown.any():
+        if strict:
+            raise ValueError(f"Questions not in instrument {bank.version}: {sorted(df.loc[unknown, 'questions'].unique())}")
+        df = df[~unknown]
+    df["question_id"] = df["question_id"].astype(np.int16)
+
+    submissions = df.drop_duplicates("submission_id")[SUBMISSION_COLUMNS].reset_index(drop=True)
+
+    is_question = df["question_id"].map(lambda i: isinstance(bank.by_id[i], Question)).astype(bool)
+    answers = df[is_question]
+    codes = answers["option_code"].to_numpy(dtype=np.int8)
+    if (codes == -2).any():
+        if strict:
+            raise ValueError(f"Answers that are not options of their question: {answers['answer'][codes == -2].tolist()}")
+        codes[codes == -2] = -1
+    responses = pd.DataFrame({
+        "submission_id": answers["submission_id"].to_numpy(),
+        "question_id": answers["question_id"].to_numpy(),
+        "option_code": codes,
+        "score": pd.to_numeric(answers["score"], errors="coerce").fillna(0).to_numpy(dtype=np.float32),
+    })
+
+    comments = df[~is_question & df["answer"].notna()]
+    comments = comments[comments["answer"].astype(str) != ""]
+    comments = comments[["submission_id", "question_id", "answer"]].rename(columns={"answer": "text"})
+    return submissions, responses, comments.reset_index(drop=True), int(unknown.sum())
+
+
+def flatten(submissions, responses, comments, bank=QUESTION_BANK):
+    """Rebuild the flat one-row-per-question table from the normalized frames."""
+    if submissions.empty:
+        return pd.DataFrame(columns=ASSESSMENT_COLUMNS)
+    n_ids = max(bank.by_id) + 1
+    texts = np.full(n_ids, None, dtype=object)
+    sections = np.full(n_ids, None, dtype=object)
+    positions = np.full(n_ids, -1)
+    width = max(max(q.option_ids) for q in bank.questions) + 1
+    # option_texts[question_id, option_code]; the extra last column (code -1) is None
+    option_texts = np.full((n_ids, width + 1), None, dtype=object)
+    for position, row in enumerate(bank.rows):
+        texts[row.id], sections[row.id], positions[row.id] = row.text, row.section, position
+        if isinstance(row, Question):
+            option_texts[row.id, list(row.option_ids)] = row.options
+
+    question_ids = responses["question_id"].to_numpy(dtype=int)
+    rows = pd.concat([
+        pd.DataFrame({"submission_id": responses["submission_id"].to_numpy(), "question_id": question_ids,
+                      "answer": option_texts[question_ids, responses["option_code"].to_numpy(dtype=int)],
+                      "score": responses["score"].to_numpy(dtype=float)}),
+        pd.DataFrame({"submission_id": comments["submission_id"].to_numpy(),
+                      "question_id": comments["question_id"].to_numpy(dtype=int),
+                      "answer": comments["text"].to_numpy(dtype=object), "score": np.nan}),
+    ], ignore_index=True)
+
+    # Comment boxes left empty have no stored row; restore them as blanks
+    expected = pd.MultiIndex.from_product(
+        [submissions["submission_id"], [row.id for row in bank.rows if not isinstance(row, Question)]],
+        names=["submission_id", "question_id"]).to_frame(index=False)
+    missing = expected.merge(rows[["submission_id", "question_id"]], how="left", indicator=True)
+    missing = missing[missing["_merge"] == "left_only"].drop(columns="_merge").assign(answer="", score=np.nan)
+    rows = pd.concat([rows, missing], ignore_index=True)
+
+    order = {submission_id: i for i, submission_id in enumerate(submissions["submission_id"])}
+    rows["order"] = rows["submission_id"].map(order)
+    rows["position"] = positions[rows["question_id"].to_numpy(dtype=int)]
+    rows = rows.dropna(subset=["order"]).sort_values(["order", "position"], kind="stable")
+    flat = rows.merge(submissions, on="submission_id", how="left", sort=False)
+    flat["questions"] = texts[flat["question_id"].to_numpy(dtype=int)]
+    flat["section"] = sections[flat["question_id"].to_numpy(dtype=int)]
+    # The texts are the current instrument's, whatever version the answers were recorded with
+    flat["instrument_version"] = bank.version
+    return flat.reindex(columns=ASSESSMENT_COLUMNS).reset_index(drop=True)
+
+
+def version_map(bank=QUESTION_BANK):
+    """Lookup table from the (question_id, option_code) of every known
+    instrument version to the current ones, for joining historical data by
+    integer keys. Retired questions map to -1.
+    """
+    frames = []
+    for version in [bank.version, *bank.migrations]:
+        source = question_bank_for_version(version, bank)
+        pairs = [(row.id, option_id) for row in source.questions for option_id in (-1, *row.option_ids)]
+        old_ids, old_options = (np.array(column, dtype=int) for column in zip(*pairs))
+        new_ids, new_options = migrate_ids(bank, version, old_ids, old_options)
+        frames.append(pd.DataFrame({"from_version": version, "from_question_id": old_ids,
+                                    "from_option_code": old_options, "question_id": new_ids,
+                                    "option_code": np.where(new_ids == -1, -1, new_options)}))
+    return pd.concat(frames, ignore_index=True).astype(
+        {"from_question_id": np.int16, "from_option_code": np.int8, "question_id": np.int16, "option_code": np.int8})
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from question_bank import QUESTION_BANK, InstrumentError, score_codes
+from schema import encode_rows, split_submissions, submission_ids
+
+
+SCORING_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_config.json")
+
+NORMALIZATIONS = ("raw", "percent")
+
+
+def _compile_thresholds(spec, name):
+    if not spec or "max" in spec[-1]:
+        raise InstrumentError(f"'{name}' must end with an open-ended level")
+    bounds = [level["max"] for level in spec[:-1]]
+    if bounds != sorted(bounds):
+        raise InstrumentError(f"'{name}' bounds must be increasing")
+    return np.array(bounds + [np.inf], dtype=float), np.array([level["level"] for level in spec], dtype=object)
+
+
+class ScoringEngine:
+    """Maturity scoring compiled from a versioned methodology config.
+
+    A question scores ``weight * (option index + 1)``, where the weight is the
+    instrument weight times any override in ``question_weights``. Section
+    scores are sums of their questions. The total is either the sum of
+    section scores times ``section_weights`` (``normalization = "raw"``) or
+    the weighted mean of section percentages of their maximum ("percent").
+    Either way the total is linear in the option points, so it is computed
+    as one dot product per assessment and can be updated answer by answer.
+    """
+
+    def __init__(self, config, bank=QUESTION_BANK):
+        self.config = config
+        self.bank = bank
+        self.version = config["version"]
+        if config.get("instrument_version") not in (None, bank.version):
+            raise InstrumentError(
+                f"Scoring config {self.version} is for instrument {config['instrument_version']}, not {bank.version}")
+        self.normalization = config.get("normalization", "raw")
+        if self.normalization not in NORMALIZATIONS:
+            raise InstrumentError(f"Unknown normalization '{self.normalization}'")
+
+        overrides = config.get("question_weights", {})
+        unknown = set(overrides) - {q.key for q in bank.questions}
+        if unknown:
+            raise InstrumentError(f"Unknown question keys in question_weights: {sorted(unknown)}")
+        self.question_weights = bank.weights * np.array([overrides.get(q.key, 1) for q in bank.questions], dtype=float)
+
+        section_ids = [section.id for section in bank.sections]
+        unknown = set(config.get("section_weights", {})) - set(section_ids)
+        if unknown:
+            raise InstrumentError(f"Unknown sections in section_weights: {sorted(unknown)}")
+        self.section_titles = [section.title for section in bank.sections]
+        self.section_weights = np.array(
+            [config.get("section_weights", {}).get(section_id, 1) for section_id in section_ids], dtype=float)
+
+        # question id -> response vector position (-1 for comment boxes)
+        self.positions = np.full(max(bank.by_id) + 1, -1)
+        for question in bank.questions:
+            self.positions[question.id] = question.position
+
+        # membership[q, s] = 1 when question q belongs to section s
+        self.membership = np.zeros((len(bank.questions), len(bank.sections)))
+        for s, section in enumerate(bank.sections):
+            for question in section.questions:
+                self.membership[question.position, s] = 1
+        n_options = np.array([len(q.options) for q in bank.questions], dtype=float)
+        self.section_max = (self.question_weights * n_options) @ self.membership
+
+        # total = section_factors @ section scores = total_coefficients @ points,
+        # with points = option index + 1 (0 if unanswered)
+        if self.normalization == "raw":
+            self.section_factors = self.section_weights
+        else:
+            self.section_factors = 100 * self.section_weights / (self.section_max * self.section_weights.sum())
+        self.total_max = float(self.section_max @ self.section_factors)
+        self.total_coefficients = self.question_weights * (self.membership @ self.section_factors)
+
+        self.level_bounds, self.level_names = _compile_thresholds(config["thresholds"], "thresholds")
+        self.section_level_bounds, self.section_level_names = _compile_thresholds(
+            config.get("section_thresholds", config["thresholds"]), "section_thresholds")
+
+    @staticmethod
+    def points(codes):
+        codes = np.asarray(codes)
+        return np.where(codes >= 0, codes + 1, 0)
+
+    def question_scores(self, codes):
+        return score_codes(codes, self.question_weights)
+
+    def section_scores(self, codes):
+        return self.question_scores(codes) @ self.membership
+
+    def section_percent(self, codes):
+        return 100 * self.section_scores(codes) / self.section_max
+
+    def total(self, codes):
+        return self.points(codes) @ self.total_coefficients
+
+    def levels(self, totals):
+        return self.level_names[np.searchsorted(self.level_bounds, np.asarray(totals, dtype=float), side="left")]
+
+    def level(self, total):
+        return self.levels([total])[0]
+
+    def section_levels(self, percent):
+        # Level of each section percentage, like levels() for totals
+        return self.section_level_names[np.searchsorted(self.section_level_bounds, percent, side="left")]
+
+    def grade(self, codes):
+        """Total, maturity level and per-section scores for a matrix of responses."""
+        codes = np.atleast_2d(codes)
+        totals = self.total(codes)
+        result = pd.DataFrame({"total_score": totals, "maturity_level": self.levels(totals)})
+        sections = self.section_scores(codes)
+        percent = 100 * sections / self.section_max
+        levels = self.section_levels(percent)
+        for s, title in enumerate(self.section_titles):
+            result[f"{title} score"] = sections[:, s]
+            result[f"{title} %"] = percent[:, s].round(1)
+            result[f"{title} level"] = levels[:, s]
+        return result
+
+    def stored_codes(self, df):
+        """Response matrix of stored flat rows: (submissions frame, codes)."""
+        submissions, responses, _, _ = split_submissions(df, self.bank, strict=False)
+        # (question id, option id) -> option index
+        option_index = np.full((len(self.positions), max(max(q.option_ids) for q in self.bank.questions) + 2), -1)
+        for question in self.bank.questions:
+            option_index[question.id, list(question.option_ids)] = question.option_indices
+        question_ids = responses["question_id"].to_numpy(dtype=int)
+        codes = np.full((len(submissions), len(self.bank.questions)), -1, dtype=np.int8)
+        index = pd.Index(submissions["submission_id"])
+        codes[index.get_indexer(responses["submission_id"]), self.positions[question_ids]] = \
+            option_index[question_ids, responses["option_code"].to_numpy(dtype=int)]
+        return submissions, codes
+
+    def regrade(self, df):
+        """Re-score stored flat rows with this methodology in one vectorized pass.
+
+        Returns ``(rows, graded)``: the input rows with ``score`` and
+        ``maturity_level`` recomputed, and one graded row per submission.
+        """
+        submissions, codes = self.stored_codes(df)
+        graded = pd.concat([submissions.drop(columns="maturity_level").reset_index(drop=True), self.grade(codes)],
+                           axis=1)
+        rows = df.copy()
+        # Each row's score is looked up in the response matrix by (submission, question position)
+        question_ids, _ = encode_rows(rows, self.bank)
+        row_positions = np.where(question_ids >= 0, self.positions[question_ids], -1)
+        row_submissions = pd.Index(submissions["submission_id"]).get_indexer(submission_ids(rows))
+        scored = (row_positions >= 0) & (row_submissions >= 0)
+        scores = np.full(len(rows), np.nan)
+        scores[scored] = self.question_scores(codes)[row_submissions[scored], row_positions[scored]]
+        rows["score"] = scores
+        levels = pd.Series(graded["maturity_level"].to_numpy(), index=graded["submission_id"])
+        rows["maturity_level"] = submission_ids(rows).map(levels).to_numpy()
+        return rows, graded
+
+
+def load_scoring_engine(path=SCORING_CONFIG_PATH, bank=QUESTION_BANK):
+    with open(path, encoding="utf-8") as f:
+        return ScoringEngine(json.load(f), bank)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_scoring_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = load_scoring_engine(os.environ.get("ICSPS_SCORING_CONFIG", SCORING_CONFIG_PATH))
+        return _engine
+
+
+def determine_maturity_level(total_score):
+    return get_scoring_engine().level(total_score)
@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+import pandas as pd
+
+from sheets import get_connection, is_not_found
+from telemetry import span
+
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_AGE_SECONDS = 15 * 60
+DEFAULT_MAX_SHEETS = 4
+
+
+def _pad(rows, width):
+    # The API drops trailing empty cells; keep every row as wide as the header
+    return [list(row[:width]) + [""] * (width - len(row)) for row in rows]
+
+
+def _frame(header, rows):
+    from gspread.utils import numericise_all
+
+    # Same values as get_all_records: numbers come back as int/float
+    return pd.DataFrame([numericise_all(row) for row in rows], columns=header)
+
+
+class _CachedSheet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.restored = False
+        self.header = None
+        self.n_rows = 0
+        self.last_row = None
+        self.frame = None
+        self.checked_at = 0.0
+        self.loaded_at = 0.0
+        # Set by writers: refresh before the next read (stale) or reload it all (reload)
+        self.stale = False
+        self.reload = False
+
+
+class SheetCache:
+    """Read-through cache of whole worksheets, shared by every session of the process.
+
+    A read within ``ttl`` seconds of the last check is served from memory.
+    After that, one request fetches the live header and the rows from the
+    last cached one down: if the header and that row are unchanged only the
+    new rows are added, otherwise the sheet is read again in full, as it is
+    every ``max_age`` seconds to catch edits further up. Writes made through
+    ``append_to_sheet`` mark the sheet for a refresh right away.
+
+    At most ``max_sheets`` sheets are kept in memory, least recently read
+    first out. With a ``path`` the rows are also kept in SQLite, so a new
+    process starts from there with a delta refresh instead of a full read.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL_SECONDS, max_age=DEFAULT_MAX_AGE_SECONDS,
+                 max_sheets=DEFAULT_MAX_SHEETS):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_sheets = max_sheets
+        self._lock = threading.Lock()
+        self._sheets = OrderedDict()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self.connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS cached_sheets ("
+                    "sheet_name TEXT PRIMARY KEY, header TEXT NOT NULL, checked_at REAL NOT NULL, "
+                    "loaded_at REAL NOT NULL)")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS cached_rows ("
+                    "sheet_name TEXT NOT NULL, row INTEGER NOT NULL, cells TEXT NOT NULL, "
+                    "PRIMARY KEY (sheet_name, row)) WITHOUT ROWID")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _entry(self, sheet_name):
+        with self._lock:
+            entry = self._sheets.get(sheet_name)
+            if entry is None:
+                entry = self._sheets[sheet_name] = _CachedSheet()
+                while len(self._sheets) > self.max_sheets:
+                    self._sheets.popitem(last=False)
+            self._sheets.move_to_end(sheet_name)
+            return entry
+
+    def frame(self, sheet_name):
+        """The sheet as ``get_all_records`` would return it, as a DataFrame copy."""
+        entry = self._entry(sheet_name)
+        with entry.lock:
+            if not entry.restored:
+                self._restore(sheet_name, entry)
+            now = time.time()
+            try:
+                if entry.header is None or entry.reload or now - entry.loaded_at > self.max_age:
+                    self._load(sheet_name, entry)
+                elif entry.stale or now - entry.checked_at > self.ttl:
+                    self._refresh(sheet_name, entry)
+            except Exception as e:
+                if is_not_found(e):
+                    # Renamed or recreated: look the sheet up by title again next time
+                    get_connection().invalidate(sheet_name)
+                    entry.reload = True
+                raise
+            return entry.frame.copy()
+
+    def expire(self, sheet_name):
+        # Rows were appended: fetch them on the next read
+        with self._lock:
+            entry = self._sheets.get(sheet_name)
+        if entry is not None:
+            entry.stale = True
+
+    def invalidate(self, sheet_name=None):
+        # Rows were changed or removed: read the whole sheet again on the next read
+        with self._lock:
+            entries = list(self._sheets.values()) if sheet_name is None else [self._sheets.get(sheet_name)]
+        for entry in entries:
+            if entry is not None:
+                entry.reload = True
+
+    def _load(self, sheet_name, entry):
+        entry.stale = entry.reload = False
+        sheet = get_connection().worksheet(sheet_name)
+        with span("sheets.get", sheet=sheet_name, cache="full"):
+            values = sheet.get(pad_values=True)
+        header = list(values[0]) if values and values[0] else []
+        rows = _pad(values[1:], len(header)) if header else []
+        entry.header = header
+        entry.n_rows = len(rows)
+        entry.last_row = rows[-1] if rows else header
+        entry.frame = _frame(header, rows) if header else pd.DataFrame()
+        entry.checked_at = entry.loaded_at = time.time()
+        self._store(sheet_name, entry, rows, replace=True)
+
+    def _refresh(self, sheet_name, entry):
+        if not entry.header:
+            self._load(sheet_name, entry)
+            return
+        entry.stale = False
+        from gspread.utils import rowcol_to_a1
+
+        sheet = get_connection().worksheet(sheet_name)
+        first = entry.n_rows + 1
+        last_column = rowcol_to_a1(1, len(entry.header))[:-1]
+        with span("sheets.batch_get", sheet=sheet_name, cache="delta"):
+            live_header, tail = sheet.batch_get(["1:1", f"A{first}:{last_column}"])
+        tail = _pad(tail, len(entry.header))
+        if (list(live_header[0]) if live_header else []) != entry.header or not tail or tail[0] != entry.last_row:
+            # Rows above the last cached one were inserted or removed
+            self._load(sheet_name, entry)
+            return
+        rows = tail[1:]
+        if rows:
+            entry.frame = pd.concat([entry.frame, _frame(entry.header, rows)], ignore_index=True)
+            entry.n_rows += len(rows)
+            entry.last_row = rows[-1]
+        entry.checked_at = time.time()
+        self._store(sheet_name, entry, rows, first_row=first + 1)
+
+    def _restore(self, sheet_name, entry):
+        entry.restored = True
+        if not self.path:
+            return
+        with closing(self.connect()) as connection:
+            meta = connection.execute(
+                "SELECT header, checked_at, loaded_at FROM cached_sheets WHERE sheet_name = ?",
+                (sheet_name,)).fetchone()
+            if meta is None:
+                return
+            rows = [json.loads(cells) for (cells,) in connection.execute(
+                "SELECT cells FROM cached_rows WHERE sheet_name = ? ORDER BY row", (sheet_name,))]
+        entry.header = json.loads(meta[0])
+        entry.n_rows = len(rows)
+        entry.last_row = rows[-1] if rows else entry.header
+        entry.frame = _frame(entry.header, rows) if entry.header else pd.DataFrame()
+        entry.checked_at, entry.loaded_at = meta[1], meta[2]
+
+    def _store(self, sheet_name, entry, rows, replace=False, first_row=2):
+        if not self.path:
+            return
+        with closing(self.connect()) as connection, connection:
+            if replace:
+                connection.execute("DELETE FROM cached_rows WHERE sheet_name = ?", (sheet_name,))
+            connection.execute(
+                "INSERT OR REPLACE INTO cached_sheets VALUES (?, ?, ?, ?)",
+                (sheet_name, json.dumps(entry.header), entry.checked_at, entry.loaded_at))
+            connection.executemany(
+                "INSERT OR REPLACE INTO cached_rows VALUES (?, ?, ?)",
+                [(sheet_name, first_row + i, json.dumps(row)) for i, row in enumerate(rows)])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_sheet_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SheetCache(
+                os.environ.get("ICSPS_SHEET_CACHE_PATH", "data/sheet_cache.sqlite3"),
+                ttl=float(os.environ.get("ICSPS_SHEET_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                max_age=float(os.environ.get("ICSPS_SHEET_CACHE_MAX_AGE", DEFAULT_MAX_AGE_SECONDS)),
+                max_sheets=int(os.environ.get("ICSPS_SHEET_CACHE_SHEETS", DEFAULT_MAX_SHEETS)))
+        return _cache
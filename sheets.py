@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from telemetry import span
+
+
+SCOPES = ["https://spreadsheets.google.com/feeds",
+          "https://www.googleapis.com/auth/drive"]
+
+# Refresh the access token this long before Google expires it
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Sheets API quota is 60 read and 60 write requests per minute per user
+DEFAULT_READS_PER_MINUTE = 60
+DEFAULT_WRITES_PER_MINUTE = 60
+BURST = 10
+
+READ_METHODS = {"row_values", "col_values", "batch_get", "get", "get_all_records", "get_all_values",
+                "get_values", "acell", "cell", "range"}
+WRITE_METHODS = {"append_rows", "append_row", "update", "update_cells", "batch_update", "resize",
+                 "add_rows", "add_cols", "clear", "delete_rows", "insert_rows", "batch_clear"}
+
+
+def service_account_info():
+    # Read Google Drive credentials from environment variable
+    return {
+        "type": os.environ["GOOGLE_TYPE"],
+        "project_id": os.environ["GOOGLE_PROJECT_ID"],
+        "private_key_id": os.environ["GOOGLE_PRIVATE_KEY_ID"],
+        "private_key": os.environ["GOOGLE_PRIVATE_KEY"].replace('\\n', '\n'),
+        "client_email": os.environ["GOOGLE_CLIENT_EMAIL"],
+        "client_id": os.environ["GOOGLE_CLIENT_ID"],
+        "auth_uri": os.environ["GOOGLE_AUTH_URI"],
+        "token_uri": os.environ["GOOGLE_TOKEN_URI"],
+        "auth_provider_x509_cert_url": os.environ["GOOGLE_AUTH_PROVIDER_X509_CERT_URL"],
+        "client_x509_cert_url": os.environ["GOOGLE_CLIENT_X509_CERT_URL"]
+    }
+
+
+class TokenBucket:
+    """Requests per minute with a small burst; callers wait for a token
+    instead of failing with HTTP 429."""
+
+    def __init__(self, per_minute, burst=BURST):
+        self.rate = per_minute / 60
+        self.capacity = max(1, min(burst, per_minute))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def penalize(self):
+        # Google said 429 anyway (other clients share the quota): start from empty
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
+
+    def status(self):
+        with self._lock:
+            self._refill()
+            return {"tokens": round(self._tokens, 2), "waiting": self.waiting}
+
+
+def _is_rate_limited(error):
+    return getattr(getattr(error, "response", None), "status_code", None) == 429
+
+
+def is_not_found(error):
+    # The cached spreadsheet key or worksheet no longer exists (renamed, recreated)
+    return getattr(getattr(error, "response", None), "status_code", None) == 404
+
+
+class _Throttled:
+    """Proxy that takes a read or write token before each API method of the
+    wrapped gspread object."""
+
+    def __init__(self, target, reads, writes):
+        self._target = target
+        self._reads = reads
+        self._writes = writes
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name == "spreadsheet":
+            return _Throttled(attribute, self._reads, self._writes)
+        bucket = self._reads if name in READ_METHODS else self._writes if name in WRITE_METHODS else None
+        if bucket is None or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            bucket.acquire()
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                if _is_rate_limited(e):
+                    bucket.penalize()
+                raise
+        return call
+
+
+class SheetsConnection:
+    """One gspread client per process, shared by every Streamlit session.
+
+    Sheet titles are resolved to spreadsheet keys once and worksheet handles
+    are kept open, so a write costs a single request to the Sheets API.
+    Every request takes a token from the process-wide read or write bucket.
+    """
+
+    def __init__(self, info=None, reads_per_minute=None, writes_per_minute=None):
+        self._info = info
+        self.reads = TokenBucket(reads_per_minute or int(
+            os.environ.get("ICSPS_SHEETS_READS_PER_MINUTE", DEFAULT_READS_PER_MINUTE)))
+        self.writes = TokenBucket(writes_per_minute or int(
+            os.environ.get("ICSPS_SHEETS_WRITES_PER_MINUTE", DEFAULT_WRITES_PER_MINUTE)))
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._client = None
+        self._sheet_keys = {}
+        self._worksheets = {}
+
+    def _refresh_if_needed(self):
+        from google.auth.transport.requests import Request
+
+        creds = self._credentials
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if creds.token is None or creds.expiry is None or creds.expiry - TOKEN_REFRESH_MARGIN <= now:
+            with span("authenticate", step="refresh"):
+                creds.refresh(Request())
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # gspread and google-auth load on the first request, not at app start
+                import gspread
+                from google.oauth2 import service_account
+
+                with span("authenticate", step="authorize"):
+                    self._credentials = service_account.Credentials.from_service_account_info(
+                        self._info or service_account_info(), scopes=SCOPES)
+                    self._client = gspread.authorize(self._credentials)
+            self._refresh_if_needed()
+            return self._client
+
+    def sheet_key(self, sheet_name):
+        with self._lock:
+            key = self._sheet_keys.get(sheet_name)
+        if key is None:
+            # Wait for a token before taking the lock, so a throttled lookup
+            # does not hold up other threads' cached handles and writes
+            self.reads.acquire()
+            with self._lock:
+                key = self._sheet_keys.get(sheet_name)
+                if key is None:
+                    # Opening by title is a Drive search; only do it once per title
+                    key = self.client().open(sheet_name).id
+                    self._sheet_keys[sheet_name] = key
+        return key
+
+    def worksheet(self, sheet_name, index=0):
+        client = self.client()
+        with self._lock:
+            handle = self._worksheets.get((sheet_name, index))
+        if handle is None:
+            key = self.sheet_key(sheet_name)
+            self.reads.acquire()
+            with self._lock:
+                handle = self._worksheets.get((sheet_name, index))
+                if handle is None:
+                    handle = _Throttled(client.open_by_key(key).get_worksheet(index), self.reads, self.writes)
+                    self._worksheets[(sheet_name, index)] = handle
+        return handle
+
+    def throttle_status(self):
+        return {"reads": self.reads.status(), "writes": self.writes.status()}
+
+    def invalidate(self, sheet_name=None):
+        # Drop cached keys/handles, e.g. after a sheet was renamed or recreated
+        with self._lock:
+            if sheet_name is None:
+                self._sheet_keys.clear()
+                self._worksheets.clear()
+                return
+            self._sheet_keys.pop(sheet_name, None)
+            for cache_key in [k for k in self._worksheets if k[0] == sheet_name]:
+                del self._worksheets[cache_key]
+
+
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def get_connection():
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            _connection = SheetsConnection()
+        return _connection
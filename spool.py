@@ -0,0 +1,252 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from itertools import takewhile
+
+import pandas as pd
+
+from aggregates import get_aggregate_store
+from dependencies import ConcurrentWriteError
+from storage import get_storage
+from telemetry import span
+
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+POLL_SECONDS = 5
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    # gspread.exceptions.APIError and requests errors carry the HTTP response
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError, OSError, ConcurrentWriteError))
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay + random.uniform(0, delay / 2)
+
+
+def _payload(df):
+    frame = df.astype(object).where(df.notna(), None)
+    return json.dumps(frame.to_dict(orient="records"), default=str)
+
+
+class SubmissionSpool:
+    """Durable write-behind queue for submitted assessments.
+
+    ``enqueue`` stores the frame in a local SQLite file and returns at once.
+    A daemon thread drains pending items to ``target`` (a storage backend) in
+    batches, backing off exponentially on 429/5xx and network errors. A batch
+    rejected for any other reason is retried one submission at a time, so
+    only the bad ones fail. Items that keep failing are marked ``failed`` and
+    stay in the spool for retry.
+    """
+
+    def __init__(self, path, target):
+        self.path = path
+        self.target = target
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+                "country TEXT, period_of_review TEXT, created_at REAL NOT NULL, "
+                "mode TEXT NOT NULL DEFAULT 'append', "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_spool_status ON spool (status, next_attempt_at)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_spool_submission ON spool (country, period_of_review, status)")
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def enqueue(self, df, mode="append"):
+        if mode not in ("append", "upsert"):
+            raise ValueError(f"Unknown write mode: {mode}")
+        first = df.iloc[0] if len(df) else {}
+        with closing(self.connect()) as connection, connection:
+            cursor = connection.execute(
+                "INSERT INTO spool (payload, mode, country, period_of_review, created_at) VALUES (?, ?, ?, ?, ?)",
+                (_payload(df), mode, first.get("country"), first.get("period_of_review"), time.time()))
+        self.start()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="submission-spool", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                print(e)
+                drained = 0
+            if not drained:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+
+    def drain_once(self):
+        with closing(self.connect()) as connection:
+            items = connection.execute(
+                "SELECT id, payload, mode, attempts FROM spool WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?", (time.time(), BATCH_SIZE)).fetchall()
+            if not items:
+                return 0
+            # Appends are sent together; an upsert replaces one submission on its own
+            if items[0]["mode"] == "upsert":
+                items = items[:1]
+            else:
+                items = list(takewhile(lambda item: item["mode"] == "append", items))
+            error = self._send(items)
+            if error is None:
+                self._mark_sent(connection, items)
+                return len(items)
+            if is_retryable(error) or len(items) == 1:
+                self._mark_failed(connection, items, error)
+                return 0
+            # One bad submission must not fail the whole batch: send them one by one
+            sent = 0
+            for item in items:
+                item_error = self._send([item])
+                if item_error is None:
+                    self._mark_sent(connection, [item])
+                    sent += 1
+                else:
+                    self._mark_failed(connection, [item], item_error)
+            return sent
+
+    def _send(self, items):
+        # The error raised by the target, or None once the items are stored
+        try:
+            batch = pd.concat([pd.DataFrame(json.loads(item["payload"])) for item in items],
+                              ignore_index=True)
+            with span("spool.drain", mode=items[0]["mode"], submissions=len(items)):
+                if items[0]["mode"] == "upsert":
+                    self.target.upsert(batch)
+                else:
+                    self.target.append(batch)
+        except Exception as e:
+            print(e)
+            return e
+        record_stored(batch)
+        return None
+
+    def _mark_sent(self, connection, items):
+        ids = [item["id"] for item in items]
+        marks = ", ".join("?" for _ in ids)
+        with connection:
+            connection.execute(
+                f"UPDATE spool SET status = 'sent', last_error = NULL WHERE id IN ({marks})", ids)
+
+    def _mark_failed(self, connection, items, error):
+        with connection:
+            for item in items:
+                attempts = item["attempts"] + 1
+                if is_retryable(error) and attempts < MAX_ATTEMPTS:
+                    connection.execute(
+                        "UPDATE spool SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, time.time() + backoff_seconds(attempts), repr(error), item["id"]))
+                else:
+                    connection.execute(
+                        "UPDATE spool SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, repr(error), item["id"]))
+
+    def has_pending(self, country, period_of_review):
+        with closing(self.connect()) as connection:
+            return connection.execute(
+                "SELECT 1 FROM spool WHERE country = ? AND period_of_review = ? AND status != 'sent' LIMIT 1",
+                (country, period_of_review)).fetchone() is not None
+
+    def retry_failed(self):
+        with closing(self.connect()) as connection, connection:
+            count = connection.execute(
+                "UPDATE spool SET status = 'pending', attempts = 0, next_attempt_at = 0 "
+                "WHERE status = 'failed'").rowcount
+        self._wake.set()
+        return count
+
+    def status(self):
+        with closing(self.connect()) as connection:
+            counts = dict(connection.execute(
+                "SELECT status, COUNT(*) FROM spool GROUP BY status").fetchall())
+            items = pd.read_sql_query(
+                "SELECT id, country, period_of_review, mode, status, attempts, "
+                "datetime(created_at, 'unixepoch') AS created_at, "
+                "datetime(next_attempt_at, 'unixepoch') AS next_attempt_at, last_error "
+                "FROM spool WHERE status != 'sent' ORDER BY id", connection)
+        return {
+            "pending": counts.get("pending", 0),
+            "failed": counts.get("failed", 0),
+            "sent": counts.get("sent", 0),
+            "items": items,
+        }
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def write_behind_enabled(environ=os.environ):
+    return environ.get("ICSPS_WRITE_BEHIND", "1").lower() not in ("0", "false", "no")
+
+
+def get_spool():
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = SubmissionSpool(
+                os.environ.get("ICSPS_SPOOL_PATH", "data/spool.sqlite3"), get_storage())
+            _spool.start()
+        return _spool
+
+
+def submit_assessment(df, mode="append"):
+    if write_behind_enabled():
+        # Saved to the local spool; a background worker pushes it on
+        get_spool().enqueue(df, mode=mode)
+    elif mode == "upsert":
+        get_storage().upsert(df)
+        record_stored(df)
+    else:
+        get_storage().append(df)
+        record_stored(df)
+
+
+def record_stored(df):
+    # Keep the dashboard aggregates in step with what has been stored
+    try:
+        get_aggregate_store().apply(df)
+    except Exception as e:
+        print(e)
+
+
+def assessment_exists(country, period_of_review):
+    if write_behind_enabled() and get_spool().has_pending(country, period_of_review):
+        return True
+    return get_storage().exists(country, period_of_review)
@@ -0,0 +1,392 @@
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import closing
+from urllib.parse import quote
+
+import pandas as pd
+
+from dependencies import append_to_sheet, submission_exists, submission_keys
+from question_bank import LEGACY_INSTRUMENT_VERSION, QUESTION_BANK
+from schema import (ASSESSMENT_COLUMNS, COMMENT_COLUMNS, RESPONSE_COLUMNS, SUBMISSION_COLUMNS,
+                    VERSION_MAP_COLUMNS, flatten, split_submissions, submission_ids, version_map)
+from sheet_cache import get_sheet_cache
+
+
+DEFAULT_SHEET_NAME = "icsps_data_for_pbi"
+
+
+class StorageBackend(ABC):
+    """Where submitted assessments are persisted.
+
+    ``append`` takes the flat frame built by the Data Entry page and ``read``
+    returns the same shape, optionally filtered on equality of columns.
+    ``upsert`` replaces whatever is stored for the frame's
+    (country, period_of_review) and ``exists`` checks for such a submission.
+    """
+
+    name = None
+
+    @abstractmethod
+    def append(self, df):
+        ...
+
+    @abstractmethod
+    def upsert(self, df):
+        ...
+
+    @abstractmethod
+    def exists(self, country, period_of_review):
+        ...
+
+    @abstractmethod
+    def read(self, **filters):
+        ...
+
+
+def _apply_filters(df, filters):
+    for column, value in filters.items():
+        df = df[df[column] == value]
+    return df.reset_index(drop=True)
+
+
+class GoogleSheetsBackend(StorageBackend):
+    name = "sheets"
+
+    def __init__(self, sheet_name=DEFAULT_SHEET_NAME):
+        self.sheet_name = sheet_name
+
+    def append(self, df):
+        append_to_sheet(df, self.sheet_name)
+
+    def upsert(self, df):
+        append_to_sheet(df, self.sheet_name, mode="upsert")
+
+    def exists(self, country, period_of_review):
+        return submission_exists(self.sheet_name, country, period_of_review)
+
+    def read(self, **filters):
+        # Served from the process-wide cache, which only fetches new rows
+        return _apply_filters(get_sheet_cache().frame(self.sheet_name), filters)
+
+
+class SQLiteBackend(StorageBackend):
+    """Local system of record in a normalized schema.
+
+    ``submissions`` holds one row per submission (indexed on country and
+    period_of_review), ``responses`` one (submission_id, question_id,
+    option_code, score) row per question and ``comments`` the comment boxes.
+    The ``assessments_flat`` view rebuilds the flat sheet shape on demand.
+
+    With ``mirror_sheet`` set, submissions not yet pushed to that Google Sheet
+    are appended to it after every write; a sync cursor per target keeps track.
+    Submissions replaced locally are upserted in the sheet rather than appended.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, mirror_sheet=None, bank=QUESTION_BANK):
+        self.path = path
+        self.mirror_sheet = mirror_sheet
+        self.bank = bank
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._create_schema()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _create_schema(self):
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    submission_id INTEGER PRIMARY KEY, seq INTEGER NOT NULL UNIQUE,
+                    country TEXT, assessors_name TEXT, assessors_affiliation TEXT,
+                    period_of_review TEXT, date_of_assessment TEXT, maturity_level TEXT, participants TEXT,
+                    instrument_version TEXT);
+                CREATE INDEX IF NOT EXISTS idx_submissions_country_period
+                    ON submissions (country, period_of_review);
+                CREATE TABLE IF NOT EXISTS responses (
+                    submission_id INTEGER NOT NULL, question_id INTEGER NOT NULL,
+                    option_code INTEGER NOT NULL, score REAL,
+                    PRIMARY KEY (submission_id, question_id)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS comments (
+                    submission_id INTEGER NOT NULL, question_id INTEGER NOT NULL, text TEXT,
+                    PRIMARY KEY (submission_id, question_id)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS questions (
+                    question_id INTEGER PRIMARY KEY, text TEXT, section TEXT, position INTEGER);
+                CREATE TABLE IF NOT EXISTS options (
+                    question_id INTEGER, option_code INTEGER, text TEXT,
+                    PRIMARY KEY (question_id, option_code)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS instrument_map (
+                    from_version TEXT, from_question_id INTEGER, from_option_code INTEGER,
+                    question_id INTEGER, option_code INTEGER,
+                    PRIMARY KEY (from_version, from_question_id, from_option_code)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS sync_state (target TEXT PRIMARY KEY, last_id INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS replaced_submissions (
+                    country TEXT, period_of_review TEXT, PRIMARY KEY (country, period_of_review));
+            """)
+            for table, column in (("submissions", "instrument_version TEXT"), ("questions", "position INTEGER")):
+                existing = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+                if column.split()[0] not in existing:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            connection.execute("UPDATE submissions SET instrument_version = ? WHERE instrument_version IS NULL",
+                               (LEGACY_INSTRUMENT_VERSION,))
+            # Dimension tables follow the current instrument; retired questions
+            # keep their id and text for older submissions but no position
+            connection.execute("UPDATE questions SET position = NULL")
+            connection.executemany(
+                "INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?)",
+                [(row.id, row.text, row.section, position) for position, row in enumerate(self.bank.rows)])
+            connection.executemany(
+                "INSERT OR REPLACE INTO options VALUES (?, ?, ?)",
+                [(row.id, option_id, option) for row in self.bank.questions
+                 for option_id, option in zip(row.option_ids, row.options)])
+            connection.execute("DELETE FROM instrument_map")
+            connection.executemany(
+                "INSERT INTO instrument_map VALUES (?, ?, ?, ?, ?)",
+                [(version, int(a), int(b), int(c), int(d)) for version, a, b, c, d
+                 in version_map(self.bank)[VERSION_MAP_COLUMNS].itertuples(index=False, name=None)])
+            connection.executescript("""
+                DROP VIEW IF EXISTS assessments_flat;
+                CREATE VIEW assessments_flat AS
+                    SELECT s.seq, q.question_id, q.position, q.text AS questions, o.text AS answer, r.score AS score,
+                           s.country, s.assessors_name, s.assessors_affiliation, s.period_of_review,
+                           s.date_of_assessment, q.section, s.maturity_level, s.participants, s.instrument_version
+                    FROM responses r
+                    JOIN submissions s ON s.submission_id = r.submission_id
+                    JOIN questions q ON q.question_id = r.question_id
+                    LEFT JOIN options o ON o.question_id = r.question_id AND o.option_code = r.option_code
+                    UNION ALL
+                    SELECT s.seq, q.question_id, q.position, q.text, COALESCE(c.text, ''), NULL,
+                           s.country, s.assessors_name, s.assessors_affiliation, s.period_of_review,
+                           s.date_of_assessment, q.section, s.maturity_level, s.participants, s.instrument_version
+                    FROM submissions s
+                    JOIN questions q ON q.position IS NOT NULL AND q.question_id NOT IN (SELECT question_id FROM options)
+                    LEFT JOIN comments c ON c.submission_id = s.submission_id AND c.question_id = q.question_id;
+            """)
+            legacy = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'assessments'").fetchone()
+        if legacy:
+            self._migrate_flat_table()
+
+    def _migrate_flat_table(self):
+        # Databases created before the normalized schema stored one flat row per question
+        with closing(self.connect()) as connection:
+            legacy = pd.read_sql_query(
+                f"SELECT id, {', '.join(c for c in ASSESSMENT_COLUMNS if c != 'instrument_version')} "
+                "FROM assessments ORDER BY id", connection)
+        with self._write_lock, closing(self.connect()) as connection, connection:
+            if not legacy.empty:
+                self._insert(connection, legacy.drop(columns="id"), strict=False)
+                self._migrate_sync_cursors(connection, legacy)
+            connection.execute("ALTER TABLE assessments RENAME TO assessments_legacy")
+
+    def _migrate_sync_cursors(self, connection, legacy):
+        # Cursors counted flat row ids; move each to the seq of the last
+        # submission before the first one that was not fully pushed
+        last_rows = legacy.groupby(submission_ids(legacy))["id"].max()
+        seqs = dict(connection.execute("SELECT submission_id, seq FROM submissions").fetchall())
+        synced = pd.DataFrame({"last_row": last_rows.to_numpy(), "seq": [seqs[i] for i in last_rows.index]})
+        for target, last_id in connection.execute("SELECT target, last_id FROM sync_state").fetchall():
+            pending = synced.loc[synced["last_row"] > last_id, "seq"]
+            last_seq = int(pending.min()) - 1 if not pending.empty else int(synced["seq"].max())
+            connection.execute("UPDATE sync_state SET last_id = ? WHERE target = ?", (last_seq, target))
+
+    def _insert(self, connection, df, strict=True):
+        submissions, responses, comments, _ = split_submissions(df, self.bank, strict=strict)
+        next_seq = connection.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM submissions").fetchone()[0]
+        submissions = submissions.assign(seq=range(next_seq, next_seq + len(submissions)))
+        submissions["date_of_assessment"] = submissions["date_of_assessment"].astype(str)
+        submissions = submissions.astype(object).where(submissions.notna(), None)
+        columns = SUBMISSION_COLUMNS + ["seq"]
+        connection.executemany(
+            f"INSERT OR REPLACE INTO submissions ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            submissions[columns].itertuples(index=False, name=None))
+        connection.executemany(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+            ((int(a), int(b), int(c), float(d)) for a, b, c, d in responses[RESPONSE_COLUMNS].itertuples(index=False, name=None)))
+        connection.executemany(
+            "INSERT OR REPLACE INTO comments VALUES (?, ?, ?)",
+            ((int(a), int(b), str(c)) for a, b, c in comments[COMMENT_COLUMNS].itertuples(index=False, name=None)))
+
+    def _delete(self, connection, keys):
+        for country, period_of_review in keys:
+            ids = [row[0] for row in connection.execute(
+                "SELECT submission_id FROM submissions WHERE country = ? AND period_of_review = ?",
+                (country, period_of_review))]
+            for table in ("responses", "comments", "submissions"):
+                connection.executemany(f"DELETE FROM {table} WHERE submission_id = ?", [(i,) for i in ids])
+
+    def _mirror(self):
+        if self.mirror_sheet:
+            try:
+                self.sync_to_sheet(self.mirror_sheet)
+            except Exception as e:
+                # The rows are safe locally; the next sync picks them up
+                print(e)
+
+    def append(self, df):
+        with self._write_lock, closing(self.connect()) as connection, connection:
+            self._insert(connection, df)
+        self._mirror()
+
+    def upsert(self, df):
+        keys = set(submission_keys(df))
+        with self._write_lock, closing(self.connect()) as connection, connection:
+            self._delete(connection, keys)
+            if self.mirror_sheet:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO replaced_submissions (country, period_of_review) VALUES (?, ?)", keys)
+            self._insert(connection, df)
+        self._mirror()
+
+    def exists(self, country, period_of_review):
+        with closing(self.connect()) as connection:
+            return connection.execute(
+                "SELECT 1 FROM submissions WHERE country = ? AND period_of_review = ? LIMIT 1",
+                (country, period_of_review)).fetchone() is not None
+
+    def _read_flat(self, connection, where="", params=()):
+        query = f"SELECT seq, {', '.join(ASSESSMENT_COLUMNS)} FROM assessments_flat"
+        if where:
+            query += f" WHERE {where}"
+        df = pd.read_sql_query(query + " ORDER BY seq, position", connection, params=list(params))
+        # Texts come from the current instrument; the submissions table keeps the recorded version
+        df["instrument_version"] = self.bank.version
+        return df
+
+    def read(self, **filters):
+        unknown = set(filters) - set(ASSESSMENT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        with closing(self.connect()) as connection:
+            return self._read_flat(connection, where, filters.values())[ASSESSMENT_COLUMNS]
+
+    def sync_to_sheet(self, sheet_name):
+        with self._write_lock, closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT last_id FROM sync_state WHERE target = ?", (sheet_name,)).fetchone()
+            last_seq = row["last_id"] if row else 0
+            pending = self._read_flat(connection, "seq > ?", (last_seq,))
+            if pending.empty:
+                return 0
+            replaced = {tuple(row) for row in connection.execute(
+                "SELECT country, period_of_review FROM replaced_submissions").fetchall()}
+            pending_keys = submission_keys(pending)
+            is_replaced = [key in replaced for key in pending_keys]
+            appended = pending[[not flag for flag in is_replaced]]
+            if not appended.empty:
+                append_to_sheet(appended[ASSESSMENT_COLUMNS], sheet_name)
+            for key, block in pending[is_replaced].groupby(["country", "period_of_review"]):
+                append_to_sheet(block[ASSESSMENT_COLUMNS], sheet_name, mode="upsert")
+                with connection:
+                    connection.execute(
+                        "DELETE FROM replaced_submissions WHERE country = ? AND period_of_review = ?", key)
+            with connection:
+                connection.execute(
+                    "INSERT INTO sync_state (target, last_id) VALUES (?, ?) "
+                    "ON CONFLICT(target) DO UPDATE SET last_id = excluded.last_id",
+                    (sheet_name, int(pending["seq"].max())))
+            return pending["seq"].nunique()
+
+
+class ParquetBackend(StorageBackend):
+    """Normalized Parquet tables partitioned as ``country=<..>/period_of_review=<..>/``.
+
+    ``submissions``, ``responses`` and ``comments`` each get their own
+    directory; ``read`` joins them back into the flat shape.
+    """
+
+    name = "parquet"
+    tables = ("submissions", "responses", "comments")
+
+    def __init__(self, root, bank=QUESTION_BANK):
+        self.root = root
+        self.bank = bank
+        os.makedirs(root, exist_ok=True)
+
+    def partition_dir(self, table, country, period_of_review):
+        # Hive-style directories, percent-encoded the way pyarrow decodes them
+        return os.path.join(self.root, table, f"country={quote(str(country), safe='')}",
+                            f"period_of_review={quote(str(period_of_review), safe='')}")
+
+    def append(self, df):
+        submissions, responses, comments, _ = split_submissions(df, self.bank)
+        submissions["date_of_assessment"] = pd.to_datetime(submissions["date_of_assessment"])
+        keys = submissions.set_index("submission_id")[["country", "period_of_review"]]
+        part = f"part-{uuid.uuid4().hex}.parquet"
+        for table, frame in zip(self.tables, (submissions, responses, comments)):
+            if "country" not in frame:
+                frame = frame.join(keys, on="submission_id")
+            for (country, period_of_review), block in frame.groupby(["country", "period_of_review"], sort=False):
+                directory = self.partition_dir(table, country, period_of_review)
+                os.makedirs(directory, exist_ok=True)
+                # A new uniquely named file per write, so appends never rewrite old data
+                block.drop(columns=["country", "period_of_review"]).to_parquet(
+                    os.path.join(directory, part), index=False)
+
+    def upsert(self, df):
+        for country, period_of_review in set(submission_keys(df)):
+            for table in self.tables:
+                shutil.rmtree(self.partition_dir(table, country, period_of_review), ignore_errors=True)
+        self.append(df)
+
+    def exists(self, country, period_of_review):
+        return os.path.isdir(self.partition_dir("submissions", country, period_of_review))
+
+    def _read_table(self, table, columns, filters):
+        path = os.path.join(self.root, table)
+        if not os.path.isdir(path) or not os.listdir(path):
+            return pd.DataFrame(columns=columns)
+        pushdown = [(column, "==", value) for column, value in filters.items()] or None
+        df = pd.read_parquet(path, filters=pushdown)
+        for column in ("country", "period_of_review"):
+            df[column] = df[column].astype(str)
+        # Part files written before a column existed lack it
+        return df.reindex(columns=columns)
+
+    def read(self, **filters):
+        partition_filters = {k: v for k, v in filters.items() if k in ("country", "period_of_review")}
+        submissions = self._read_table("submissions", SUBMISSION_COLUMNS, partition_filters)
+        submissions = submissions.sort_values("date_of_assessment", kind="stable")
+        responses = self._read_table("responses", RESPONSE_COLUMNS, partition_filters)
+        comments = self._read_table("comments", COMMENT_COLUMNS, partition_filters)
+        flat = flatten(submissions, responses, comments, self.bank)
+        return _apply_filters(flat, {k: v for k, v in filters.items() if k not in partition_filters})
+
+
+def storage_from_config(environ=os.environ):
+    # ICSPS_STORAGE_BACKEND selects the engine: sheets (default), sqlite or parquet
+    backend = environ.get("ICSPS_STORAGE_BACKEND", "sheets").lower()
+    sheet_name = environ.get("ICSPS_SHEET_NAME", DEFAULT_SHEET_NAME)
+    if backend == "sheets":
+        return GoogleSheetsBackend(sheet_name)
+    if backend == "sqlite":
+        mirror = environ.get("ICSPS_SQLITE_MIRROR_SHEET", "").lower() in ("1", "true", "yes")
+        return SQLiteBackend(environ.get("ICSPS_SQLITE_PATH", "data/icsps.sqlite3"),
+                             mirror_sheet=sheet_name if mirror else None)
+    if backend == "parquet":
+        return ParquetBackend(environ.get("ICSPS_PARQUET_DIR", "data/parquet"))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = storage_from_config()
+        return _storage
@@ -0,0 +1,217 @@
+"""Timing spans for reruns, scoring and Google Sheets I/O.
+
+Off unless ``ICSPS_TELEMETRY`` lists one or more exporters:
+
+- ``log``: one OpenTelemetry-style JSON span per line, to stdout or
+  ``ICSPS_TELEMETRY_LOG``
+- ``prometheus``: a ``icsps_span_duration_seconds`` histogram served at
+  ``http://<host>:<ICSPS_METRICS_PORT>/metrics`` (default port 9464)
+
+The last ``ICSPS_TELEMETRY_RECENT`` (default 50) top-level spans are kept in
+memory for the in-app debug panel. When disabled, ``span`` returns a shared
+no-op and ``timed`` leaves the function undecorated.
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+EXPORTERS = ("log", "prometheus")
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def telemetry_exporters(environ=os.environ):
+    names = {name.strip().lower() for name in environ.get("ICSPS_TELEMETRY", "").split(",") if name.strip()}
+    unknown = names - set(EXPORTERS) - {"off"}
+    if unknown:
+        raise ValueError(f"Unknown telemetry exporters: {sorted(unknown)}")
+    return names & set(EXPORTERS)
+
+
+_exporters = telemetry_exporters()
+ENABLED = bool(_exporters)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span = contextvars.ContextVar("icsps_span", default=None)
+
+
+class Span:
+    def __init__(self, name, attributes, recent=True):
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        # Top-level spans go to the debug panel unless this is off
+        self.recent = recent
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._start
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        self.error = repr(exc) if exc is not None else None
+        _current_span.reset(self._token)
+        recorder.record(self)
+        return False
+
+
+def span(name, **attributes):
+    """Context manager timing a block; ``attributes`` are attached to the span."""
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def timed(name, recent=True):
+    """Decorator timing every call of a function as span ``name``.
+
+    Use ``recent=False`` for frequent calls outside a rerun (widget
+    callbacks), which would otherwise crowd the debug panel.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(name, {}, recent=recent):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Recorder:
+    """Collects finished spans: histograms for Prometheus, recent top-level spans
+    for the debug panel and, with the ``log`` exporter, one JSON line each."""
+
+    def __init__(self, exporters, recent=50, log_path=None):
+        self.exporters = exporters
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        # span name -> [count, sum, per-bucket counts]
+        self._histograms = {}
+
+    def record(self, finished):
+        summary = {"name": finished.name, "duration_ms": round(1000 * finished.duration, 3),
+                   "attributes": finished.attributes, "error": finished.error, "children": finished.children}
+        with self._lock:
+            histogram = self._histograms.setdefault(finished.name, [0, 0.0, [0] * len(BUCKETS)])
+            histogram[0] += 1
+            histogram[1] += finished.duration
+            for i, bound in enumerate(BUCKETS):
+                if finished.duration <= bound:
+                    histogram[2][i] += 1
+            if finished.parent is None and finished.recent:
+                self._recent.append({"start": finished.start_ns / 1e9, **summary})
+        if finished.parent is not None:
+            finished.parent.children.append(summary)
+        if "log" in self.exporters:
+            self._log(finished)
+
+    def _log(self, finished):
+        line = json.dumps({
+            "name": finished.name,
+            "context": {"trace_id": finished.trace_id, "span_id": finished.span_id},
+            "parent_id": finished.parent.span_id if finished.parent else None,
+            "start_time_unix_nano": finished.start_ns,
+            "end_time_unix_nano": finished.end_ns,
+            "attributes": finished.attributes,
+            "status": {"status_code": "ERROR" if finished.error else "OK", "description": finished.error},
+        }, default=str)
+        if self.log_path:
+            with self._lock, open(self.log_path, "a") as f:
+                f.write(line + "\n")
+        else:
+            print(line, file=sys.stdout, flush=True)
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def prometheus(self):
+        lines = ["# HELP icsps_span_duration_seconds Duration of instrumented operations",
+                 "# TYPE icsps_span_duration_seconds histogram"]
+        with self._lock:
+            for name, (count, total, buckets) in sorted(self._histograms.items()):
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append(f'icsps_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {bucket_count}')
+                lines.append(f'icsps_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'icsps_span_duration_seconds_sum{{span="{name}"}} {total}')
+                lines.append(f'icsps_span_duration_seconds_count{{span="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+recorder = Recorder(_exporters, recent=int(os.environ.get("ICSPS_TELEMETRY_RECENT", "50")),
+                    log_path=os.environ.get("ICSPS_TELEMETRY_LOG"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = recorder.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            port = port or int(os.environ.get("ICSPS_METRICS_PORT", "9464"))
+            try:
+                _metrics_server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves the port
+                print(e)
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        return _metrics_server
+
+
+def debug_panel_enabled(environ=os.environ):
+    return ENABLED and environ.get("ICSPS_DEBUG_PANEL", "").lower() in ("1", "true", "yes")
+
+
+if "prometheus" in _exporters:
+    start_metrics_server()